@@ -0,0 +1,146 @@
+import math
+
+import numpy as np
+from sqlalchemy import and_, select, union
+from models import Game, Pricing, Sales
+
+
+def load_history(session, game_ids=None, platform_id=None):
+    """
+    Loads every year of pricing and sales of the selected games in one query and
+    returns it as columnar NumPy arrays ordered by game and year. Years with only a
+    price or only sales have NaN in the missing columns.
+    :param session: The session used for the query.
+    :param game_ids: Optional ids of the games to load.
+    :param platform_id: Optional id of the platform to load the games of.
+    :return: A dict of equally long arrays: game_id, platform_id, year, price, digital_sales, hard_copy_sales.
+    """
+    pricing_years = select(Pricing.game_id, Pricing.year)
+    sales_years = select(Sales.game_id, Sales.year)
+
+    # Filter inside both halves of the union so only the selected games' years are collected.
+    if game_ids is not None:
+        pricing_years = pricing_years.where(Pricing.game_id.in_(game_ids))
+        sales_years = sales_years.where(Sales.game_id.in_(game_ids))
+    if platform_id is not None:
+        platform_games = select(Game.id).where(Game.platform_id == platform_id)
+        pricing_years = pricing_years.where(Pricing.game_id.in_(platform_games))
+        sales_years = sales_years.where(Sales.game_id.in_(platform_games))
+
+    years = union(pricing_years, sales_years).subquery()
+    query = select(Game.id, Game.platform_id, years.c.year, Pricing.price, Sales.digital_sales,
+                   Sales.hard_copy_sales) \
+        .join(years, years.c.game_id == Game.id) \
+        .outerjoin(Pricing, and_(Pricing.game_id == Game.id, Pricing.year == years.c.year)) \
+        .outerjoin(Sales, and_(Sales.game_id == Game.id, Sales.year == years.c.year)) \
+        .order_by(Game.id, years.c.year)
+
+    rows = session.execute(query).all()
+    columns = list(zip(*rows)) if rows else [()] * 6
+
+    return {
+        "game_id": np.array(columns[0], dtype=np.int64),
+        "platform_id": np.array(columns[1], dtype=np.int64),
+        "year": np.array(columns[2], dtype=np.int64),
+        "price": np.array(columns[3], dtype=np.float64),
+        "digital_sales": np.array(columns[4], dtype=np.float64),
+        "hard_copy_sales": np.array(columns[5], dtype=np.float64),
+    }
+
+
+def aggregate_by_platform(history):
+    """
+    Collapses per-game history into one row per platform and year, summing sales
+    and averaging the known prices.
+    :param history: Arrays as returned by load_history.
+    :return: A dict of equally long arrays: platform_id, year, price, digital_sales, hard_copy_sales.
+    """
+    keys = np.stack([history["platform_id"], history["year"]], axis=1)
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    groups = len(unique_keys)
+
+    price = history["price"]
+    known = ~np.isnan(price)
+    price_total = np.bincount(inverse, weights=np.where(known, price, 0), minlength=groups)
+    price_count = np.bincount(inverse, weights=known, minlength=groups)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average_price = np.where(price_count > 0, price_total / price_count, np.nan)
+
+    return {
+        "platform_id": unique_keys[:, 0],
+        "year": unique_keys[:, 1],
+        "price": average_price,
+        "digital_sales": np.bincount(inverse, weights=np.nan_to_num(history["digital_sales"]), minlength=groups),
+        "hard_copy_sales": np.bincount(inverse, weights=np.nan_to_num(history["hard_copy_sales"]), minlength=groups),
+    }
+
+
+def compute_metrics(history, key, window=3):
+    """
+    Computes time-series metrics for every series in one vectorized pass. Rows must
+    be ordered by series and year.
+    :param history: Arrays as returned by load_history or aggregate_by_platform.
+    :param key: The array identifying the series, "game_id" or "platform_id".
+    :param window: The number of years in the price moving average.
+    :return: A dict of arrays aligned with the input rows: yoy_price_change,
+             price_moving_average, cumulative_sales and digital_share.
+    """
+    series, years, price = history[key], history["year"], history["price"]
+    size = len(series)
+    index = np.arange(size)
+
+    starts = np.ones(size, dtype=bool)
+    starts[1:] = series[1:] != series[:-1]
+    series_start = np.maximum.accumulate(np.where(starts, index, 0))
+
+    # Year-over-year change only compares a year with the one right before it of the same series.
+    previous_price = np.concatenate(([np.nan], price[:-1]))
+    previous_year = np.concatenate(([0], years[:-1]))
+    # A change from a price of 0, such as a free title's, has no ratio.
+    previous_price[starts | (years - previous_year != 1) | (previous_price <= 0)] = np.nan
+
+    known = ~np.isnan(price)
+    price_sums = np.concatenate(([0.0], np.cumsum(np.where(known, price, 0))))
+    price_counts = np.concatenate(([0], np.cumsum(known)))
+    window_start = np.maximum(index - window + 1, series_start)
+    window_count = price_counts[index + 1] - price_counts[window_start]
+
+    total_sales = np.nan_to_num(history["digital_sales"]) + np.nan_to_num(history["hard_copy_sales"])
+    sales_sums = np.concatenate(([0.0], np.cumsum(total_sales)))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "yoy_price_change": (price - previous_price) / previous_price,
+            "price_moving_average": np.where(
+                window_count > 0, (price_sums[index + 1] - price_sums[window_start]) / window_count, np.nan),
+            "cumulative_sales": sales_sums[index + 1] - sales_sums[series_start],
+            "digital_share": np.where(total_sales > 0, np.nan_to_num(history["digital_sales"]) / total_sales, np.nan),
+        }
+
+
+def to_series(history, metrics, key):
+    """
+    Splits columnar arrays into one JSON-ready dict per series, with NaN and infinite
+    values as None, which JSON cannot represent.
+    :param history: Arrays as returned by load_history or aggregate_by_platform.
+    :param metrics: Arrays as returned by compute_metrics.
+    :param key: The array identifying the series, "game_id" or "platform_id".
+    :return: A list of dicts holding one list per column.
+    """
+    columns = {"year": history["year"], "price": history["price"], "digital_sales": history["digital_sales"],
+               "hard_copy_sales": history["hard_copy_sales"], **metrics}
+    ids = history[key]
+    starts = np.flatnonzero(np.diff(ids, prepend=np.nan) != 0).tolist()
+    ends = starts[1:] + [len(ids)]
+
+    # Convert each column to Python lists once and slice those, instead of splitting every array per series.
+    lists = {}
+    for name, values in columns.items():
+        lists[name] = values.tolist()
+        if values.dtype.kind == "f":
+            lists[name] = [value if math.isfinite(value) else None for value in lists[name]]
+
+    return [{key: int(ids[start]), **{name: values[start:end] for name, values in lists.items()}}
+            for start, end in zip(starts, ends)]
@@ -0,0 +1,390 @@
+import re
+from contextlib import asynccontextmanager
+from functools import wraps
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags, quote_etag
+
+import main
+from compression import COMPRESSIBLE_MIMETYPES, COMPRESSION_MIN_SIZE, choose_encoding, compress_async_stream, \
+    compress_data
+from db import AsyncSessionFactory
+from fields import FieldsError, get_fields
+from metrics import RequestState, async_request_state, record_request
+from models import Developer, Game, Genre, Platform, Pricing, Sales, TableVersion
+from pagination import PaginationError, paginate_async
+from versioning import is_not_modified, select_table_versions, validators, versions_from_rows
+
+# The read routes served natively on the event loop. Every other route, including all writes, falls through
+# to the Flask app, which a2wsgi runs on a thread pool.
+routes = []
+
+# The engines are created by the first request that opens a session, not on import
+sessions = AsyncSessionFactory()
+
+
+# Turn a Flask rule such as /api/game/<int:game_id> into a Starlette path
+def starlette_path(rule):
+    return re.sub(r"<int:(\w+)>", r"{\1:int}", rule)
+
+
+# Whether the request may read from the replica: unless the client asks to read its own writes
+def use_replica(request):
+    return not request.headers.get(main.READ_YOUR_WRITES_HEADER)
+
+
+# The coding to compress a response of this mimetype with, or None to send it as is
+def response_encoding(request, mimetype):
+    if mimetype not in COMPRESSIBLE_MIMETYPES or request.method == "HEAD":
+        return None
+    return choose_encoding(parse_accept_header(request.headers.get("Accept-Encoding")))
+
+
+# Serialize a body exactly as the Flask app would, compressing it when the client accepts it
+def json_response(request, body, status):
+    response = main.app.json.response(body)
+    data = response.get_data()
+    headers = {"Vary": "Accept-Encoding"} if response.mimetype in COMPRESSIBLE_MIMETYPES else {}
+    encoding = response_encoding(request, response.mimetype)
+
+    if encoding and len(data) >= COMPRESSION_MIN_SIZE:
+        data = compress_data(data, encoding)
+        headers["Content-Encoding"] = encoding
+
+    return Response(data, status, headers, media_type=response.mimetype)
+
+
+# Stream every row of a statement as newline-delimited JSON, like main's stream_ndjson. The rows are read
+# through a server-side cursor on a session of their own, since the view's session is closed once it returns.
+def stream_ndjson(request, statement, to_dict):
+    replica = use_replica(request)
+
+    async def generate():
+        async with sessions(use_replica=replica) as session:
+            result = await session.stream(statement.execution_options(yield_per=main.NDJSON_BATCH_SIZE))
+            async for rows in result.partitions():
+                yield "".join(main.app.json.dumps(to_dict(row)) + "\n" for row in rows)
+
+    body = generate()
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = response_encoding(request, "application/x-ndjson")
+
+    if encoding:
+        body = compress_async_stream(body, encoding)
+        headers["Content-Encoding"] = encoding
+
+    return StreamingResponse(body, 200, headers, media_type="application/x-ndjson")
+
+
+# Register an async GET view at a Flask style rule. Like main's conditional, it answers a 304 while none of the
+# tables have changed, reads from the replica unless the client asks to read its own writes, and records the
+# same metrics under the same route label as the Flask view. A view returns a body and a status, or a
+# Response such as a stream_ndjson export.
+def route(rule, tables):
+    def decorator(view):
+        @wraps(view)
+        async def endpoint(request):
+            state = RequestState(rule)
+            token = async_request_state.set(state)
+            try:
+                response = await respond(request, view, tables)
+                state.metrics_status = response.status_code
+                return response
+            finally:
+                async_request_state.reset(token)
+                record_request(state, request.method, rule)
+
+        routes.append(Route(starlette_path(rule), endpoint, methods=["GET"]))
+        return view
+
+    return decorator
+
+
+async def respond(request, view, tables):
+    async with sessions(use_replica=use_replica(request)) as session:
+        rows = (await session.execute(select_table_versions(tables))).all()
+        etag, last_modified = validators(versions_from_rows(tables, rows))
+
+        if is_not_modified(etag, last_modified, parse_etags(request.headers.get("If-None-Match")),
+                           parse_date(request.headers.get("If-Modified-Since"))):
+            response = Response(status_code=304)
+        else:
+            try:
+                result = await view(request, session, **request.path_params)
+            except (FieldsError, PaginationError) as error:
+                result = {"error": str(error)}, 400
+
+            response = result if isinstance(result, Response) else json_response(request, *result)
+            if response.status_code != 200:
+                return response
+
+    response.headers["ETag"] = quote_etag(etag, weak=True)
+    if last_modified:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+# ============================ HEALTH START =======================================
+
+# Readiness probe: the database is reachable and has been initialized with flask init-db
+async def readyz(request):
+    try:
+        async with sessions() as session:
+            initialized = (await session.execute(select(TableVersion.name).limit(1))).first() is not None
+    except SQLAlchemyError as error:
+        return json_response(request, {"status": "unavailable", "error": type(error).__name__}, 503)
+
+    if not initialized:
+        return json_response(request, {"status": "unavailable",
+                                       "error": "Database is not initialized, run flask init-db"}, 503)
+
+    return json_response(request, {"status": "ok"}, 200)
+
+
+routes.append(Route("/readyz", readyz, methods=["GET"]))
+
+# ============================ HEALTH END =======================================
+
+
+# ============================ DEVELOPERS, GENRES AND PLATFORMS START =======================================
+
+# List the ids and names of a developers, genres or platforms table, a page at a time
+async def get_all_names(request, session, model, key):
+    results, next_cursor = await paginate_async(session.scalars, select(model), (model.id,), request.query_params)
+    return {key: [{"id": row.id, "name": row.name} for row in results], "next_cursor": next_cursor}, 200
+
+
+# Getting all Developers
+@route('/api/developer', main.DEVELOPER_TABLES)
+async def get_all_developers(request, session):
+    return await get_all_names(request, session, Developer, "developers")
+
+
+# Getting all Genres
+@route('/api/genre', main.GENRE_TABLES)
+async def get_all_genres(request, session):
+    return await get_all_names(request, session, Genre, "genres")
+
+
+# Getting all Platforms
+@route('/api/platform', main.PLATFORM_TABLES)
+async def get_all_platform(request, session):
+    return await get_all_names(request, session, Platform, "platforms")
+
+# ============================ DEVELOPERS, GENRES AND PLATFORMS END =======================================
+
+
+# ============================ GAME START =======================================
+
+# Get all Games, optionally filtered by platform, genre, developer and release date range
+@route('/api/game', main.GAME_TABLES)
+async def get_all_games(request, session):
+    fields = get_fields(main.GAME_FIELDS, request.query_params)
+
+    try:
+        key_columns, descending = main.get_game_sort(request.query_params)
+        query = main.filter_release_dates(main.query_games_with_names(fields, key_columns, build=select),
+                                          request.query_params)
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+    for dimension, cache, column in main.GAME_NAME_FILTERS:
+        name = request.query_params.get(dimension)
+        if name:
+            # The caches query through a sync Session, which run_sync lends them
+            dimension_id = await session.run_sync(cache.get_id, name)
+            if not dimension_id:
+                return {"error": f"{dimension.capitalize()} not found"}, 404
+            query = query.filter(column == dimension_id)
+
+    results, next_cursor = await paginate_async(session.scalars, query, key_columns, request.query_params,
+                                                descending=descending)
+    games = [main.game_to_dict(game, fields) for game in results]
+
+    return {"games": games, "next_cursor": next_cursor}, 200
+
+
+# Get several Games by id in one query
+@route('/api/game/batch', main.GAME_TABLES)
+async def get_games_batch(request, session):
+    fields = get_fields(main.GAME_FIELDS, request.query_params)
+
+    try:
+        game_ids = main.get_int_list('ids', required=True, args=request.query_params)
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+    query = main.query_games_with_names(fields, build=select).filter(Game.id.in_(game_ids)).order_by(Game.id)
+    results = (await session.scalars(query)).all()
+    games = [main.game_to_dict(game, fields) for game in results]
+    missing = sorted(set(game_ids) - {game.id for game in results})
+
+    return {"games": games, "missing": missing}, 200
+
+
+# Get a single Game
+@route('/api/game/<int:game_id>', main.GAME_TABLES)
+async def get_single_game(request, session, game_id):
+    fields = get_fields(main.GAME_FIELDS, request.query_params)
+    query = main.query_games_with_names(fields, build=select).filter(Game.id == game_id)
+    found_game = (await session.scalars(query)).first()
+
+    if not found_game:
+        return {"error": "Game not found"}, 404
+
+    return {"game": [main.game_to_dict(found_game, fields)]}, 200
+
+
+# Get a Game with every year of its pricing and sales, aligned by year, in one query
+@route('/api/game/<int:game_id>/timeline', main.TIMELINE_TABLES)
+async def get_game_timeline(request, session, game_id):
+    rows = (await session.execute(main.select_game_timeline(game_id))).all()
+
+    if not rows:
+        return {"error": "Game not found"}, 404
+
+    return main.game_timeline_to_dict(rows), 200
+
+# ============================ GAME END =======================================
+
+
+# ============================ PRICING AND SALES START =======================================
+
+# List the pricing or sales of every Game a page at a time, or export all of it with format=ndjson
+async def get_all_history(request, session, model, fields, to_dict, key):
+    query = main.query_with_game_names(model, fields, build=select)
+
+    if request.query_params.get('format') == 'ndjson':
+        return stream_ndjson(request, query.order_by(model.game_id, model.year), lambda row: to_dict(row, fields))
+
+    results, next_cursor = await paginate_async(session.execute, query, (model.game_id, model.year),
+                                                request.query_params)
+    return {key: [to_dict(row, fields) for row in results], "next_cursor": next_cursor}, 200
+
+
+# Read the pricing or sales of several Games, optionally limited to some years, in one query
+async def get_history_batch(session, model, fields, game_ids, years, to_dict):
+    query = main.query_with_game_names(model, fields, build=select).filter(model.game_id.in_(game_ids))
+    if years:
+        query = query.filter(model.year.in_(years))
+
+    rows = (await session.execute(query.order_by(model.game_id, model.year))).all()
+    return [{"game_id": row.game_id, **to_dict(row, fields)} for row in rows]
+
+
+# Read the optional year query argument as an integer. asyncpg casts every bind parameter to its column type and
+# rejects a string for an integer column, so it cannot be passed through as sent.
+def get_year(request):
+    year = request.query_params.get('year')
+    return None if year is None else int(year)
+
+
+# Read the pricing or sales of a single Game at one year
+async def get_single_history(session, model, fields, game_id, year):
+    query = main.query_with_game_names(model, fields, build=select) \
+        .filter(model.game_id == game_id, model.year == year)
+    return (await session.execute(query)).first()
+
+
+# Getting all Pricing information
+@route('/api/pricing', main.PRICING_TABLES)
+async def get_all_pricing(request, session):
+    fields = get_fields(main.PRICING_FIELDS, request.query_params)
+    return await get_all_history(request, session, Pricing, fields, main.pricing_to_dict, "pricings")
+
+
+# Get Pricing for several Games, optionally limited to some years, in one query
+@route('/api/pricing/batch', main.PRICING_TABLES)
+async def get_pricing_batch(request, session):
+    fields = get_fields(main.PRICING_FIELDS, request.query_params)
+
+    try:
+        game_ids = main.get_int_list('game_ids', required=True, args=request.query_params)
+        years = main.get_int_list('years', args=request.query_params)
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+    all_prices = await get_history_batch(session, Pricing, fields, game_ids, years, main.pricing_to_dict)
+
+    return {"pricings": all_prices}, 200
+
+
+# Get Pricing for a single Game
+@route('/api/pricing/<int:game_id>', main.PRICING_TABLES)
+async def get_single_game_pricing(request, session, game_id):
+    fields = get_fields(main.PRICING_FIELDS, request.query_params)
+
+    try:
+        year = get_year(request)
+    except ValueError:
+        return {"error": "year must be an integer"}, 400
+
+    pricing = await get_single_history(session, Pricing, fields, game_id, year)
+
+    if not pricing:
+        return {"error": "Pricing information not found for the specified game and year"}, 404
+
+    return {"pricing": [main.pricing_to_dict(pricing, fields)]}, 200
+
+
+# Getting all Sales information
+@route('/api/sales', main.SALES_TABLES)
+async def get_all_sales(request, session):
+    fields = get_fields(main.SALES_FIELDS, request.query_params)
+    return await get_all_history(request, session, Sales, fields, main.sales_to_dict, "sales")
+
+
+# Get Sales for several Games, optionally limited to some years, in one query
+@route('/api/sales/batch', main.SALES_TABLES)
+async def get_sales_batch(request, session):
+    fields = get_fields(main.SALES_FIELDS, request.query_params)
+
+    try:
+        game_ids = main.get_int_list('game_ids', required=True, args=request.query_params)
+        years = main.get_int_list('years', args=request.query_params)
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+    all_sales = await get_history_batch(session, Sales, fields, game_ids, years, main.sales_to_dict)
+
+    return {"sales": all_sales}, 200
+
+
+# Get Sales for a single Game
+@route('/api/sales/<int:game_id>', main.SALES_TABLES)
+async def get_single_game_sales(request, session, game_id):
+    fields = get_fields(main.SALES_FIELDS, request.query_params)
+
+    try:
+        year = get_year(request)
+    except ValueError:
+        return {"error": "year must be an integer"}, 400
+
+    sales = await get_single_history(session, Sales, fields, game_id, year)
+
+    if not sales:
+        return {"error": "Sales information not found for the specified game and year"}, 404
+
+    return {"sales": [main.sales_to_dict(sales, fields)]}, 200
+
+# ============================ PRICING AND SALES END =======================================
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await sessions.dispose()
+
+
+def create_app():
+    # Anything the async routes do not answer, including other methods on their paths, goes to Flask
+    return Starlette(routes=routes + [Mount("/", app=WSGIMiddleware(main.app))], lifespan=lifespan)
+
+
+app = create_app()
@@ -0,0 +1,545 @@
+"""
+Benchmark harness for APIVista.
+
+Fills an empty database with synthetic developers, genres, platforms, games and
+multi-year pricing and sales, then drives every route of main.py through the
+Flask test client. For each route it reports p50/p95/p99 latency, throughput,
+peak Python memory and SQL statements per request, and saves the results as
+JSON. Pass --compare with an earlier result file to fail on regressions, such as
+a route that starts issuing more statements per request. Large listings are also
+measured with each JSON provider and content coding to show their CPU and byte cost.
+With --servers, the read routes asgi.py serves natively are also load tested over
+HTTP against the gunicorn (sync) and uvicorn (async) deployments, at each of the
+--server-concurrency levels.
+
+Usage:
+    python benchmark.py --games 5000 --years 10 --output bench.json
+    python benchmark.py --compare bench.json
+    python benchmark.py --database-url postgresql://localhost/apivista_bench
+    python benchmark.py --servers --server-concurrency 1,16,64
+"""
+import argparse
+import http.client
+import json
+import os
+import platform as python_platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import sqlalchemy
+from sqlalchemy import event, func, insert, text
+
+from pagination import encode_cursor
+
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+SERVER_START_TIMEOUT = 30
+
+# One worker process each, so the comparison is between a thread pool and an event loop
+SERVER_COMMANDS = {
+    "sync": [sys.executable, "-m", "gunicorn", "--worker-class", "gthread", "--threads", "{threads}",
+             "--bind", "127.0.0.1:{port}", "main:app"],
+    "async": [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", "{port}", "--no-access-log",
+              "asgi:app"],
+}
+
+
+def generate_data(session, developers, genres, platforms, games, years, seed=0):
+    """
+    Inserts synthetic rows with batched Core inserts.
+    :param session: A session on an empty database.
+    :return: A dict with the generated ids and years, used to build request URLs.
+    """
+    from models import Developer, Genre, Platform, Game, Pricing, Sales
+    from rollup import rebuild_rollup
+    from versioning import bump_table_versions
+
+    if session.query(func.count(Game.id)).scalar():
+        raise SystemExit("The benchmark database must be empty, pass --database-url of a throwaway database.")
+
+    rng = random.Random(seed)
+    session.execute(insert(Developer), [{"id": i, "name": f"Developer {i}"} for i in range(1, developers + 1)])
+    session.execute(insert(Genre), [{"id": i, "name": f"Genre {i}"} for i in range(1, genres + 1)])
+    session.execute(insert(Platform), [{"id": i, "name": f"Platform {i}"} for i in range(1, platforms + 1)])
+
+    words = ["dark", "knight", "quest", "space", "racing", "legend", "city", "shadow", "island", "galaxy"]
+    first_year = date.today().year - years
+    session.execute(insert(Game), [{
+        "id": i,
+        "title": f"{rng.choice(words).title()} {rng.choice(words).title()} {i}",
+        "release_date": date(first_year, 1, 1) + timedelta(days=rng.randrange(365 * years)),
+        "description": " ".join(rng.choice(words) for _ in range(60)),
+        "gameplay_modes": rng.choice(["Single-player", "Multiplayer", "Single-player, Multiplayer"]),
+        "img_url": f"https://example.com/{i}.png",
+        "developer_id": rng.randint(1, developers),
+        "genre_id": rng.randint(1, genres),
+        "platform_id": rng.randint(1, platforms)
+    } for i in range(1, games + 1)])
+
+    for start in range(1, games + 1, 1000):
+        game_ids = range(start, min(start + 1000, games + 1))
+        session.execute(insert(Pricing), [{"game_id": game_id, "year": first_year + offset,
+                                           "price": round(rng.uniform(5, 70), 2)}
+                                          for game_id in game_ids for offset in range(years)])
+        session.execute(insert(Sales), [{"game_id": game_id, "year": first_year + offset,
+                                         "digital_sales": rng.randint(0, 100000),
+                                         "hard_copy_sales": rng.randint(0, 100000)}
+                                        for game_id in game_ids for offset in range(years)])
+
+    # The ids above were given explicitly, so PostgreSQL's serial sequences still start at 1 and the create
+    # scenarios would collide with them
+    if session.get_bind().dialect.name == "postgresql":
+        for model in (Developer, Genre, Platform, Game):
+            session.execute(text(f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+                                 f"(SELECT max(id) FROM {model.__tablename__}))"))
+
+    bump_table_versions(session, ("developers", "genres", "platforms", "games", "prices", "sales"))
+    rebuild_rollup(session)
+    session.commit()
+
+    return {"games": games, "developers": developers, "genres": genres, "platforms": platforms,
+            "first_year": first_year, "last_year": first_year + years - 1}
+
+
+def build_scenarios(client, session_factory, data):
+    """
+    Describes one request per route. Each scenario is (name, method, build) where
+    build(i) returns the URL and keyword arguments of the i-th request. Requests
+    that need a fresh row create it with an untimed setup request inside build.
+    """
+    from models import Developer, Genre, Platform, Game
+
+    games, year = data["games"], data["last_year"]
+    dimensions = {"developer": Developer, "genre": Genre, "platform": Platform}
+
+    def pick(count, i):
+        return i % count + 1
+
+    def page_of_ids(i):
+        return ",".join(str(pick(games, i + n)) for n in range(50))
+
+    def create(path):
+        assert client.post(path).status_code == 200, path
+
+    def find_id(model, column, value):
+        with session_factory() as session:
+            return session.query(model.id).filter(column == value).scalar()
+
+    def new_game(i, tag):
+        title = f"bench {tag} {i}"
+        create(f"/api/game?title={title}&description=d&release_date=January/01/2020&gameplay_modes=s"
+               f"&developer=Developer 1&genre=Genre 1&platform=Platform 1")
+        return find_id(Game, Game.title, title)
+
+    def new_priced_game(kind, values, i, tag):
+        game_id = new_game(i, f"{tag} {kind}")
+        create(f"/api/{kind}/{game_id}?{values}&year={year}")
+        return game_id
+
+    def new_dimension(kind, i, tag):
+        name = f"bench {tag} {i}"
+        create(f"/api/{kind}?name={name}")
+        return find_id(dimensions[kind], dimensions[kind].name, name)
+
+    scenarios = [
+        ("home", "GET", lambda i: ("/", {})),
+        ("healthz", "GET", lambda i: ("/healthz", {})),
+        ("readyz", "GET", lambda i: ("/readyz", {})),
+        ("metrics", "GET", lambda i: ("/metrics", {})),
+    ]
+
+    for kind, count in (("developer", data["developers"]), ("genre", data["genres"]),
+                        ("platform", data["platforms"])):
+        scenarios += [
+            (f"list {kind}", "GET", lambda i, kind=kind: (f"/api/{kind}", {})),
+            (f"get {kind}", "GET", lambda i, kind=kind, count=count: (f"/api/{kind}/{pick(count, i)}", {})),
+            (f"add {kind}", "POST", lambda i, kind=kind: (f"/api/{kind}?name=bench add {i}", {})),
+            (f"update {kind}", "PATCH",
+             lambda i, kind=kind: (f"/api/{kind}/{new_dimension(kind, i, 'update')}?name=bench renamed {i}", {})),
+            (f"delete {kind}", "DELETE",
+             lambda i, kind=kind: (f"/api/{kind}/{new_dimension(kind, i, 'delete')}", {})),
+        ]
+
+    scenarios += [
+        ("list game", "GET", lambda i: ("/api/game", {})),
+        ("list game filtered", "GET",
+         lambda i: (f"/api/game?platform=Platform {pick(data['platforms'], i)}&sort=-release_date", {})),
+        ("list game narrow", "GET", lambda i: ("/api/game?fields=id,title,platform_id", {})),
+        ("get game", "GET", lambda i: (f"/api/game/{pick(games, i)}", {})),
+        ("game timeline", "GET", lambda i: (f"/api/game/{pick(games, i)}/timeline", {})),
+        ("get game batch", "GET", lambda i: (f"/api/game/batch?ids={page_of_ids(i)}", {})),
+        ("search game", "GET", lambda i: ("/api/game/search?q=dark knight", {})),
+        ("add game", "POST", lambda i: (f"/api/game?title=bench add {i}&description=d&release_date=January/01/2020"
+                                        f"&gameplay_modes=s&developer=Developer 1&genre=Genre 1&platform=Platform 1",
+                                        {})),
+        ("bulk add game", "POST", lambda i: ("/api/game/bulk", {"json": [{
+            "title": f"bench bulk {i} {n}", "description": "d", "release_date": "January/01/2020",
+            "gameplay_modes": "s", "developer": "Developer 1", "genre": "Genre 1", "platform": "Platform 1"
+        } for n in range(100)]})),
+        ("update game", "PATCH",
+         lambda i: (f"/api/game/{pick(games, i)}?title=Renamed {i}&description=d&gameplay_modes=s", {})),
+        ("delete game", "DELETE", lambda i: (f"/api/game/{new_game(i, 'delete')}", {})),
+    ]
+
+    for kind, values in (("pricing", "price=19.99"), ("sales", "digital_sales=10&hard_copy_sales=20")):
+        scenarios += [
+            (f"list {kind}", "GET", lambda i, kind=kind: (f"/api/{kind}", {})),
+            (f"export {kind}", "GET", lambda i, kind=kind: (f"/api/{kind}?format=ndjson", {})),
+            (f"get {kind}", "GET", lambda i, kind=kind: (f"/api/{kind}/{pick(games, i)}?year={year}", {})),
+            (f"get {kind} batch", "GET", lambda i, kind=kind: (f"/api/{kind}/batch?game_ids={page_of_ids(i)}", {})),
+            (f"add {kind}", "POST",
+             lambda i, kind=kind, values=values: (f"/api/{kind}/{pick(games, i)}?{values}&year={year + 1 + i}", {})),
+            (f"update {kind}", "PATCH", lambda i, kind=kind, values=values: (
+                f"/api/{kind}/{new_priced_game(kind, values, i, 'update')}?{values}&year={year}", {})),
+            (f"delete {kind}", "DELETE", lambda i, kind=kind, values=values: (
+                f"/api/{kind}/{new_priced_game(kind, values, i, 'delete')}?year={year}", {})),
+        ]
+
+    scenarios += [
+        ("trends", "GET", lambda i: ("/api/trends?group_by=year,platform", {})),
+        ("sales leaderboard", "GET", lambda i: (f"/api/leaderboards/sales?by=platform&year={year}", {})),
+        ("pricing leaderboard", "GET", lambda i: (f"/api/leaderboards/pricing?by=genre&year={year}", {})),
+        ("timeseries", "GET", lambda i: (f"/api/analytics/timeseries?game_ids={page_of_ids(i)}", {})),
+        ("timeseries post", "POST", lambda i: (
+            "/api/analytics/timeseries", {"json": {"game_ids": [int(game_id) for game_id in page_of_ids(i).split(",")]}})),
+        ("changes", "GET", lambda i: ("/api/changes?limit=100", {})),
+        ("list snapshots", "GET", lambda i: ("/api/snapshots", {})),
+        ("get snapshot", "GET", lambda i: ("/api/snapshots/pricing", {})),
+        ("get snapshot range", "GET", lambda i: ("/api/snapshots/sales", {"headers": {"Range": "bytes=0-65535"}})),
+    ]
+
+    return scenarios
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(client, engine, method, build, requests, memory_requests):
+    """
+    Times a scenario, then replays a few requests under tracemalloc for peak memory.
+    :return: A dict of the scenario's measurements.
+    """
+    statements = []
+    latencies = []
+    statuses = {}
+    urls = []
+
+    def count_statement(*args):
+        statements[-1] += 1
+
+    for i in range(requests):
+        # Setup requests made by build are neither timed nor counted.
+        url, kwargs = build(i)
+        urls.append(url)
+        statements.append(0)
+        event.listen(engine, "before_cursor_execute", count_statement)
+        try:
+            start = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statement)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    tracemalloc.start()
+    peak = 0
+    for i in range(requests, requests + memory_requests):
+        url, kwargs = build(i)
+        tracemalloc.reset_peak()
+        client.open(url, method=method, **kwargs).get_data()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        "method": method,
+        "url": urls[0].split("?")[0],
+        "requests": requests,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_rps": requests / sum(latencies),
+        "peak_memory_kb": peak / 1024,
+        "statements_per_request": sum(statements) / len(statements),
+        "max_statements_per_request": max(statements),
+    }
+
+
+def run_payload_benchmark(app, client, urls, requests):
+    """
+    Measures the CPU time and bytes of large responses for every combination of JSON
+    provider and content coding, to show what orjson and compression save.
+    :return: A dict keyed by "url provider encoding".
+    """
+    from flask.json.provider import DefaultJSONProvider
+    from compression import supported_encodings
+    from json_provider import create_json_provider
+
+    providers = {"json": DefaultJSONProvider(app), "orjson": create_json_provider(app)}
+    original = app.json
+    results = {}
+
+    try:
+        for url in urls:
+            for provider_name, provider in providers.items():
+                app.json = provider
+                for encoding in ["identity"] + supported_encodings():
+                    cpu_times, sizes = [], []
+                    for _ in range(requests):
+                        start = time.process_time()
+                        response = client.get(url, headers={"Accept-Encoding": encoding})
+                        sizes.append(len(response.get_data()))
+                        cpu_times.append(time.process_time() - start)
+                    results[f"{url} {provider_name} {encoding}"] = {
+                        "cpu_ms": percentile(cpu_times, 0.50) * 1000,
+                        "bytes": sizes[-1],
+                    }
+    finally:
+        app.json = original
+
+    return results
+
+
+def server_urls(data):
+    """
+    :return: A mix of requests to the read routes asgi.py serves natively.
+    """
+    games, year = data["games"], data["last_year"]
+    urls = []
+
+    for i in range(1, 51):
+        game_id = (i * 97) % games + 1
+        ids = ",".join(str((game_id + n) % games + 1) for n in range(20))
+        # Listings start after a different row each time, so the response cache of the sync app cannot answer them
+        urls += [f"/api/game/{game_id}", f"/api/game/{game_id}/timeline", f"/api/game/batch?ids={ids}",
+                 f"/api/pricing/batch?game_ids={ids}", f"/api/sales/{game_id}?year={year}",
+                 f"/api/game?limit=50&after={encode_cursor([game_id])}",
+                 f"/api/pricing?limit=100&after={encode_cursor([game_id, year])}",
+                 f"/api/sales?limit=100&after={encode_cursor([game_id, year])}"]
+
+    return urls
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(process, port):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"The server exited with status {process.returncode}.")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/healthz")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"The server did not answer /healthz within {SERVER_START_TIMEOUT}s.")
+
+
+def drive_server(port, urls, concurrency, requests):
+    """
+    Sends requests from concurrency client threads, each on its own keep-alive
+    connection, cycling through urls.
+    :return: A dict of the run's measurements.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(offset):
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        own_latencies, own_errors = [], 0
+        for i in range(offset, requests, concurrency):
+            start = time.perf_counter()
+            connection.request("GET", urls[i % len(urls)])
+            response = connection.getresponse()
+            response.read()
+            own_latencies.append(time.perf_counter() - start)
+            own_errors += response.status != 200
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_rps": len(latencies) / elapsed,
+    }
+
+
+def run_server_benchmark(database_url, urls, concurrency_levels, requests, threads):
+    """
+    Starts each deployment in SERVER_COMMANDS against the benchmark database and load
+    tests it over HTTP at every concurrency level.
+    :return: A dict keyed by "deployment concurrency".
+    """
+    results = {}
+    # The async routes have no response cache, so the sync app runs without one too and both query every request
+    env = dict(os.environ, AWS_POSTGRESQL_URL=database_url, RESPONSE_CACHE_BYTES="0")
+    # An event loop holds every client's request in flight at once. With a smaller pool the overflow connections
+    # are closed on return and reopened by the next request.
+    env.setdefault("DB_POOL_SIZE", str(max(concurrency_levels)))
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    for name, command in SERVER_COMMANDS.items():
+        port = free_port()
+        process = subprocess.Popen([part.format(port=port, threads=threads) for part in command], cwd=directory,
+                                   env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(process, port)
+            # Warm up the pools and caches before timing
+            drive_server(port, urls, max(concurrency_levels), len(urls))
+            for concurrency in concurrency_levels:
+                results[f"{name} {concurrency}"] = drive_server(port, urls, concurrency, requests)
+        finally:
+            process.terminate()
+            process.wait()
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Lists routes that got slower or issue more statements than in a previous run.
+    :return: A list of human readable regressions.
+    """
+    regressions = []
+
+    for name, current in results["routes"].items():
+        previous = baseline["routes"].get(name)
+        if not previous:
+            continue
+        if current["max_statements_per_request"] > previous["max_statements_per_request"]:
+            regressions.append(f"{name}: {previous['max_statements_per_request']} -> "
+                               f"{current['max_statements_per_request']} statements per request")
+        if current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every APIVista route against synthetic data.")
+    parser.add_argument("--database-url", help="an empty database, defaults to a temporary SQLite file")
+    parser.add_argument("--developers", type=int, default=50)
+    parser.add_argument("--genres", type=int, default=20)
+    parser.add_argument("--platforms", type=int, default=8)
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100, help="timed requests per route")
+    parser.add_argument("--memory-requests", type=int, default=5, help="requests per route traced for memory")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="a previous result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="allowed p95 slowdown before --compare reports a regression (0.2 = 20%%)")
+    parser.add_argument("--servers", action="store_true",
+                        help="also load test the sync (gunicorn) and async (uvicorn) deployments over HTTP")
+    parser.add_argument("--server-concurrency", default="1,16,64",
+                        help="comma separated numbers of concurrent clients for --servers")
+    parser.add_argument("--server-requests", type=int, default=2000,
+                        help="requests per deployment and concurrency level for --servers")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    os.environ["AWS_POSTGRESQL_URL"] = database_url
+    os.environ.setdefault("SNAPSHOT_DIR", tempfile.mkdtemp())
+
+    # main.py reads the database URL when its engine is created, and load_dotenv does not override it.
+    import main
+
+    from db import init_db
+
+    engine = main.session.get_bind()
+    init_db(engine)
+    start = time.perf_counter()
+    data = generate_data(main.session(), args.developers, args.genres, args.platforms, args.games, args.years)
+    main.session.remove()
+    print(f"Generated {args.games} games x {args.years} years in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    main.app.test_cli_runner().invoke(args=["snapshot"])
+    print(f"Built snapshots in {time.perf_counter() - start:.1f}s")
+
+    client = main.app.test_client()
+    scenarios = build_scenarios(client, main.session.session_factory, data)
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "environment": {"python": python_platform.python_version(), "sqlalchemy": sqlalchemy.__version__,
+                        "database": engine.url.get_backend_name()},
+        "routes": {}
+    }
+
+    print(f"{'route':<26}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'peak KB':>10}{'SQL/req':>9}")
+    for name, method, build in scenarios:
+        result = run_scenario(client, engine, method, build, args.requests, args.memory_requests)
+        results["routes"][name] = result
+        print(f"{name:<26}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+              f"{result['throughput_rps']:>9.0f}{result['peak_memory_kb']:>10.0f}"
+              f"{result['statements_per_request']:>9.1f}")
+
+    routes = main.app.url_map.bind("")
+    covered = {routes.match(result["url"], method=result["method"])[0] for result in results["routes"].values()}
+    missing = sorted(rule.endpoint for rule in main.app.url_map.iter_rules()
+                     if rule.endpoint not in covered and rule.endpoint != "static")
+    if missing:
+        print(f"Routes without a benchmark scenario: {', '.join(missing)}", file=sys.stderr)
+
+    payload_urls = ["/api/game?limit=1000", "/api/game?limit=1000&fields=id,title,platform_id",
+                    "/api/pricing?limit=1000", "/api/pricing?format=ndjson"]
+    results["payloads"] = run_payload_benchmark(main.app, client, payload_urls, max(1, args.requests // 10))
+    print(f"\n{'payload':<64}{'CPU ms':>9}{'bytes':>11}")
+    for name, result in results["payloads"].items():
+        print(f"{name:<64}{result['cpu_ms']:>9.2f}{result['bytes']:>11}")
+
+    if args.servers:
+        levels = [int(level) for level in args.server_concurrency.split(",")]
+        results["servers"] = run_server_benchmark(database_url, server_urls(data), levels, args.server_requests,
+                                                  os.getenv("GUNICORN_THREADS", "4"))
+        print(f"\n{'deployment':<16}{'clients':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>8}")
+        for name, result in results["servers"].items():
+            print(f"{name.split()[0]:<16}{result['concurrency']:>8}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                  f"{result['p99_ms']:>9.2f}{result['throughput_rps']:>9.0f}{result['errors']:>8}")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import insert, tuple_
+from changes import UPSERT, record_changes
+from models import Developer, Genre, Platform, Game
+from versioning import bump_table_versions
+
+BULK_BATCH_SIZE = 1000
+REQUIRED_GAME_FIELDS = ("title", "description", "release_date", "gameplay_modes", "developer", "genre", "platform")
+
+
+class BulkImportError(ValueError):
+    """Raised when a bulk import body cannot be parsed at all."""
+
+
+def read_records(request):
+    """
+    Reads the games of a bulk import request, sent either as a JSON array of objects
+    or as CSV with a header row.
+    :param request: The Flask request.
+    :return: A list of dicts, one per game.
+    """
+    if request.mimetype == "text/csv":
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+
+    records = request.get_json(silent=True)
+
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise BulkImportError("Body must be a JSON array of games or CSV with a header row.")
+
+    return records
+
+
+def resolve_names(session, model, names):
+    """
+    Resolves many names of a dimension table in one query.
+    :param session: The session used for the query.
+    :param model: Developer, Genre or Platform.
+    :param names: The names to resolve.
+    :return: A dict mapping each existing name to its id.
+    """
+    if not names:
+        return {}
+    return dict(session.query(model.name, model.id).filter(model.name.in_(names)).all())
+
+
+def import_games(session, records):
+    """
+    Inserts many games in one transaction. Developer, genre and platform names are
+    resolved with one query each, duplicates of existing (title, platform) pairs are
+    found with one query per batch, and new rows are written with a batched
+    executemany. Rows that fail validation are skipped and reported.
+    :param session: The session whose transaction the games are inserted in.
+    :param records: The games as dicts with the same fields as POST /api/game.
+    :return: A tuple of the number of inserted games and a list of per-row errors.
+    """
+    errors = []
+    valid = []
+    for row, record in enumerate(records):
+        missing = [field for field in REQUIRED_GAME_FIELDS if not record.get(field)]
+        if missing:
+            errors.append({"row": row, "error": f"Missing fields: {', '.join(missing)}"})
+            continue
+
+        # Checked before the names are gathered into sets, which a list or object value could not join
+        not_text = [field for field in REQUIRED_GAME_FIELDS if not isinstance(record[field], str)]
+        if record.get("img_url") and not isinstance(record["img_url"], str):
+            not_text.append("img_url")
+        if not_text:
+            errors.append({"row": row, "error": f"Fields must be strings: {', '.join(not_text)}"})
+            continue
+
+        try:
+            release_date = datetime.strptime(record["release_date"], '%B/%d/%Y').date()
+        except ValueError:
+            errors.append({"row": row, "error": "release_date must look like January/31/2020"})
+            continue
+
+        valid.append((row, record, release_date))
+
+    developer_ids = resolve_names(session, Developer, {record["developer"] for _, record, _ in valid})
+    genre_ids = resolve_names(session, Genre, {record["genre"] for _, record, _ in valid})
+    platform_ids = resolve_names(session, Platform, {record["platform"] for _, record, _ in valid})
+
+    candidates = []
+    for row, record, release_date in valid:
+        lookups = (("Platform", platform_ids, record["platform"]), ("Developer", developer_ids, record["developer"]),
+                   ("Genre", genre_ids, record["genre"]))
+        unknown = next((label for label, ids, name in lookups if name not in ids), None)
+        if unknown:
+            errors.append({"row": row, "error": f"{unknown} does not exist, please add the {unknown} to the database"})
+            continue
+
+        candidates.append((row, {
+            "title": record["title"],
+            "description": record["description"],
+            "release_date": release_date,
+            "gameplay_modes": record["gameplay_modes"],
+            "img_url": record.get("img_url") or None,
+            "developer_id": developer_ids[record["developer"]],
+            "genre_id": genre_ids[record["genre"]],
+            "platform_id": platform_ids[record["platform"]]
+        }))
+
+    inserted = 0
+    seen = set()
+    for start in range(0, len(candidates), BULK_BATCH_SIZE):
+        batch = candidates[start:start + BULK_BATCH_SIZE]
+        keys = {(game["title"], game["platform_id"]) for _, game in batch}
+        existing = set(session.query(Game.title, Game.platform_id)
+                       .filter(tuple_(Game.title, Game.platform_id).in_(keys)).all())
+
+        new_games = []
+        for row, game in batch:
+            key = (game["title"], game["platform_id"])
+            if key in existing or key in seen:
+                errors.append({"row": row, "error": "Game already exists for this platform."})
+                continue
+            seen.add(key)
+            new_games.append(game)
+
+        if new_games:
+            game_ids = session.scalars(insert(Game).returning(Game.id), new_games).all()
+            record_changes(session, "games", [(game_id, None) for game_id in game_ids], UPSERT)
+            inserted += len(new_games)
+
+    if inserted:
+        bump_table_versions(session, ("games",))
+
+    errors.sort(key=lambda error: error["row"])
+    return inserted, errors
@@ -0,0 +1,174 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, Integer, event, insert, literal, null, or_, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from models import ChangeLog, Developer, Genre, Platform, Game, Pricing, Sales, TableVersion
+# Imported for their before_commit listeners, which must be registered before sequence_committed_changes
+import rollup  # noqa: F401
+import versioning  # noqa: F401
+
+CHANGES_RECORDED_KEY = "changes_recorded"
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+TRACKED_TABLES = {Game: "games", Pricing: "prices", Sales: "sales"}
+
+# The column of games each dimension is referenced by; games follow their dimension's renames and deletes
+GAME_REFERENCES = {Developer: Game.developer_id, Genre: Game.genre_id, Platform: Game.platform_id}
+
+CHANGE_COLUMNS = ["table_name", "game_id", "year", "operation", "changed_at"]
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def change_key(instance):
+    """
+    :param instance: A Game, Pricing or Sales row.
+    :return: The (game_id, year) key of the row, with a year of None for games.
+    """
+    if isinstance(instance, Game):
+        return instance.id, None
+    return instance.game_id, instance.year
+
+
+def record_changes(connection, table_name, keys, operation):
+    """
+    Adds an entry to the change log for each row. Writes that bypass the ORM, such as
+    bulk inserts, call this themselves, and so does sequence_changes when they use a
+    connection rather than a session.
+    :param connection: A connection or session in the transaction of the change.
+    :param table_name: "games", "prices" or "sales".
+    :param keys: The (game_id, year) keys of the rows, with a year of None for games.
+    :param operation: UPSERT or DELETE.
+    """
+    now = utcnow()
+    entries = [{"table_name": table_name, "game_id": game_id, "year": year, "operation": operation,
+                "changed_at": now} for game_id, year in keys]
+    if entries:
+        connection.execute(insert(ChangeLog.__table__), entries)
+        mark_recorded(connection)
+
+
+def record_game_changes(connection, condition, operation, tables=("games", "prices", "sales")):
+    """
+    Adds an entry to the change log for every game matching condition and, for
+    deletes, for every pricing and sales row of those games, each with one
+    INSERT ... SELECT so no rows are loaded into Python.
+    :param connection: A connection in the transaction of the change.
+    :param condition: A filter on the games table.
+    :param operation: UPSERT or DELETE.
+    :param tables: The tables to record entries for.
+    """
+    now = literal(utcnow(), DateTime)
+    game_ids = select(Game.id).where(condition)
+    sources = {
+        "games": select(literal("games"), Game.id, null().cast(Integer), literal(operation), now).where(condition),
+        "prices": select(literal("prices"), Pricing.game_id, Pricing.year, literal(operation), now)
+        .where(Pricing.game_id.in_(game_ids)),
+        "sales": select(literal("sales"), Sales.game_id, Sales.year, literal(operation), now)
+        .where(Sales.game_id.in_(game_ids)),
+    }
+
+    for table in tables:
+        connection.execute(insert(ChangeLog.__table__).from_select(CHANGE_COLUMNS, sources[table]))
+    mark_recorded(connection)
+
+
+def mark_recorded(connection):
+    # Sessions are sequenced when they commit; connections call sequence_changes themselves
+    if not isinstance(connection, Connection):
+        connection.info[CHANGES_RECORDED_KEY] = True
+
+
+def sequence_changes(connection):
+    """
+    Stamps the entries the transaction added to the change log with the next commit
+    sequence number, which orders the change feed. The number is taken by
+    incrementing the change_log row of table_versions, whose lock is held until the
+    transaction ends, so transactions are numbered in the order they commit: once a
+    number is visible, every lower one is too, however long a transaction ran or
+    whatever the clocks of the workers say. Call it as the last write of the
+    transaction, since other writers wait on the lock until it commits.
+    :param connection: A connection or session in the transaction of the changes.
+    """
+    connection.execute(update(TableVersion).where(TableVersion.name == ChangeLog.__tablename__)
+                       .values(version=TableVersion.version + 1, updated_at=utcnow()))
+    sequence = connection.execute(select(TableVersion.version)
+                                  .where(TableVersion.name == ChangeLog.__tablename__)).scalar_one()
+    # Other transactions' entries are not visible to this one until they commit, already stamped
+    connection.execute(update(ChangeLog.__table__).where(ChangeLog.commit_sequence.is_(None))
+                       .values(commit_sequence=sequence))
+
+
+@event.listens_for(Session, "before_flush")
+def record_deletes(session, flush_context, instances):
+    # The database cascades deletes to pricing, sales and games without the ORM seeing them, so their
+    # tombstones are written before the rows are gone.
+    if not session.deleted:
+        return
+
+    connection = session.connection()
+    conditions = []
+    deleted_game_ids = set()
+
+    for instance in session.deleted:
+        if isinstance(instance, Game):
+            deleted_game_ids.add(instance.id)
+        elif type(instance) in GAME_REFERENCES:
+            conditions.append(GAME_REFERENCES[type(instance)] == instance.id)
+
+    if deleted_game_ids:
+        conditions.append(Game.id.in_(deleted_game_ids))
+    if conditions:
+        record_game_changes(connection, or_(*conditions), DELETE)
+        session.info[CHANGES_RECORDED_KEY] = True
+
+    for model in (Pricing, Sales):
+        keys = [change_key(instance) for instance in session.deleted
+                if isinstance(instance, model) and instance.game_id not in deleted_game_ids]
+        if keys:
+            record_changes(connection, TRACKED_TABLES[model], keys, DELETE)
+            session.info[CHANGES_RECORDED_KEY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def record_upserts(session, flush_context):
+    connection = session.connection()
+    keys = {table_name: [] for table_name in TRACKED_TABLES.values()}
+    renamed = []
+
+    for instance in session.new | session.dirty:
+        if not session.is_modified(instance):
+            continue
+        if type(instance) in TRACKED_TABLES:
+            keys[TRACKED_TABLES[type(instance)]].append(change_key(instance))
+        elif type(instance) in GAME_REFERENCES and instance not in session.new:
+            renamed.append(GAME_REFERENCES[type(instance)] == instance.id)
+
+    for table_name, table_keys in keys.items():
+        if table_keys:
+            record_changes(connection, table_name, table_keys, UPSERT)
+            session.info[CHANGES_RECORDED_KEY] = True
+
+    if renamed:
+        record_game_changes(connection, or_(*renamed), UPSERT, tables=("games",))
+        session.info[CHANGES_RECORDED_KEY] = True
+
+
+@event.listens_for(Session, "before_commit")
+def sequence_committed_changes(session):
+    # Runs after the before_commit listeners of versioning and rollup, so the lock on the sequence is the last one
+    # a transaction takes and the shortest held, and a writer holding it never waits on a lock another one holds.
+    session.flush()
+
+    if session.info.pop(CHANGES_RECORDED_KEY, False):
+        sequence_changes(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_recorded_changes(session):
+    session.info.pop(CHANGES_RECORDED_KEY, None)
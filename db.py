@@ -1,17 +1,207 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import os
+import threading
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from changes import sequence_changes
 from models import Base
+from search import install_search_index
+from versioning import seed_table_versions
+
+USE_REPLICA_KEY = "use_replica"
 
+# The asyncio driver used for each backend by create_async_db_engine
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
 
-def create_engine_and_session(database_url):
+
+def pool_options(database_url):
     """
-     This function creates an SQLAlchemy engine using the provided database URL,
-    initializes the tables defined in the models, and returns a sessionmaker
-    instance to create sessions connected to the engine.
+    The connection pool is tuned through environment variables so every worker
+    thread can hold its own connection:
+    DB_POOL_SIZE (default 5), DB_MAX_OVERFLOW (default 10),
+    DB_POOL_PRE_PING (default true) and DB_POOL_RECYCLE in seconds (default 1800).
     :param database_url: The URL of the database.
-    :return: An instance of the SQLAlchemy Session.
+    :return: The keyword arguments of create_engine for the pool.
+    """
+    options = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    }
+
+    # SQLite uses its own single-file pools which do not accept sizing arguments.
+    if make_url(database_url).get_backend_name() != "sqlite":
+        options["pool_size"] = int(os.getenv("DB_POOL_SIZE", 5))
+        options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", 10))
+
+    return options
+
+
+def create_db_engine(database_url):
+    """
+    This function creates an SQLAlchemy engine using the provided database URL,
+    with the pool settings of pool_options.
+    :param database_url: The URL of the database.
+    :return: An instance of the SQLAlchemy Engine.
+    """
+    return create_engine(database_url, **pool_options(database_url))
+
+
+def create_async_db_engine(database_url):
+    """
+    This function creates an SQLAlchemy AsyncEngine for the same database as
+    create_db_engine, replacing the driver of the URL with its asyncio counterpart:
+    asyncpg for PostgreSQL and aiosqlite for SQLite.
+    :param database_url: The URL of the database, as used by create_db_engine.
+    :return: An instance of the SQLAlchemy AsyncEngine.
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver is configured for {backend} databases.")
+
+    url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return create_async_engine(url, **pool_options(database_url))
+
+
+def create_missing_indexes(engine):
+    """
+    create_all only creates indexes together with new tables, so indexes added to
+    models of existing tables are created here.
+    :param engine: The engine of the database.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def add_missing_columns(engine):
+    """
+    create_all only creates columns together with new tables, so nullable columns
+    added to models of existing tables, such as updated_at, are added here. Existing
+    rows get NULL. Columns that are not nullable need a migration with a backfill.
+    :param engine: The engine of the database.
+    """
+    inspector = inspect(engine)
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable or column.server_default is not None:
+                    raise RuntimeError(f"{table.name}.{column.name} cannot be added automatically.")
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def init_db(engine):
+    """
+    Creates the tables, columns, indexes and search index the app needs, seeds the
+    table versions and sequences change log entries written before the change feed
+    was ordered by commit. Every step skips what already exists, so this is safe to
+    run on every deploy. It is run by `flask init-db` rather than on startup, so workers
+    boot without touching the schema.
+    :param engine: The engine of the database.
     """
-    engine = create_engine(database_url)
     Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
+    add_missing_columns(engine)
+    create_missing_indexes(engine)
+    seed_table_versions(engine)
+    with engine.begin() as connection:
+        sequence_changes(connection)
+    install_search_index(engine)
+
+
+class RoutingSession(Session):
+    """
+    A session that sends its reads to a read replica once use_replica() has been
+    called, e.g. for a GET request. Flushes always go to the primary, and without a
+    replica everything does.
+    """
+
+    def __init__(self, replica_bind=None, **kwargs):
+        super().__init__(**kwargs)
+        self.replica_bind = replica_bind
+
+    def use_replica(self):
+        """
+        Routes the reads of this session to the replica, if one is configured.
+        """
+        self.info[USE_REPLICA_KEY] = True
+
+    def get_bind(self, mapper=None, **kwargs):
+        if self.replica_bind is not None and self.info.get(USE_REPLICA_KEY) and not self._flushing:
+            return self.replica_bind
+        return super().get_bind(mapper, **kwargs)
+
+
+def create_scoped_session(database_url=None, replica_url=None):
+    """
+    This function returns a scoped_session registry whose engines are created on
+    first use, so importing the app neither reads the database URLs nor builds a
+    pool. Each thread gets its own RoutingSession from the registry; call remove()
+    at the end of a request to close it and return its connections to the pools.
+    :param database_url: The URL of the primary database, or None to read
+                         AWS_POSTGRESQL_URL when the first session is created.
+    :param replica_url: The URL of a read replica, or None to read the optional
+                        AWS_POSTGRESQL_REPLICA_URL when the first session is created.
+    :return: An instance of the SQLAlchemy scoped_session.
+    """
+    session_factory = sessionmaker(class_=RoutingSession)
+    lock = threading.Lock()
+
+    def create_session():
+        if session_factory.kw.get("bind") is None:
+            with lock:
+                if session_factory.kw.get("bind") is None:
+                    replica = replica_url or os.getenv("AWS_POSTGRESQL_REPLICA_URL")
+                    session_factory.configure(
+                        bind=create_db_engine(database_url or os.getenv("AWS_POSTGRESQL_URL")),
+                        replica_bind=create_db_engine(replica) if replica else None)
+        return session_factory()
+
+    return scoped_session(create_session)
+
+
+class AsyncSessionFactory:
+    """
+    Opens an AsyncSession per request for the ASGI app. Like create_scoped_session,
+    the engines are created on first use from AWS_POSTGRESQL_URL and the optional
+    AWS_POSTGRESQL_REPLICA_URL. Everything runs on one event loop, so no lock is
+    needed around that.
+    """
+
+    def __init__(self, database_url=None, replica_url=None):
+        self.database_url = database_url
+        self.replica_url = replica_url
+        self.engine = None
+        self.replica_engine = None
+
+    def __call__(self, use_replica=False):
+        """
+        :param use_replica: Whether the session should read from the replica, if one
+                            is configured.
+        :return: A new AsyncSession; use it with async with to close it.
+        """
+        if self.engine is None:
+            replica = self.replica_url or os.getenv("AWS_POSTGRESQL_REPLICA_URL")
+            self.engine = create_async_db_engine(self.database_url or os.getenv("AWS_POSTGRESQL_URL"))
+            self.replica_engine = create_async_db_engine(replica) if replica else None
+
+        if use_replica and self.replica_engine is not None:
+            return AsyncSession(self.replica_engine, expire_on_commit=False)
+        return AsyncSession(self.engine, expire_on_commit=False)
+
+    async def dispose(self):
+        """
+        Closes the connections of both pools, e.g. when the server shuts down.
+        """
+        for engine in (self.engine, self.replica_engine):
+            if engine is not None:
+                await engine.dispose()
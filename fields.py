@@ -0,0 +1,29 @@
+from flask import request
+
+
+class FieldsError(ValueError):
+    """Raised when the fields query argument names a field the route does not have."""
+
+
+def get_fields(available, args=None):
+    """
+    Reads the fields query argument of the current request, a comma separated list
+    of the response fields the client wants.
+    :param available: The names of every field the route can return.
+    :param args: The query arguments to read instead of those of the current Flask
+                 request, e.g. the query params of an ASGI request.
+    :return: The requested field names in the order of available, or all of them
+             when the argument is not given.
+    """
+    fields = (request.args if args is None else args).get("fields")
+
+    if fields is None:
+        return tuple(available)
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(available)
+
+    if unknown or not requested:
+        raise FieldsError(f"fields must be a comma separated list of {', '.join(available)}.")
+
+    return tuple(field for field in available if field in requested)
@@ -0,0 +1,184 @@
+"""
+Offline loader for Pricing and Sales history.
+
+Streams a CSV (with a header row) or NDJSON file into the prices or sales table.
+On PostgreSQL rows are COPY'd into a temporary staging table and merged with
+INSERT ... ON CONFLICT, on SQLite they are upserted with a chunked executemany.
+Rows for games that do not exist are skipped, and the trend rollup is rebuilt
+once the load is merged. Every written row is added to the change log.
+
+Usage:
+    python loader.py prices prices.csv
+    python loader.py sales sales.ndjson --chunk-size 50000
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# The local modules below read their settings from the environment when imported, so .env is loaded before them
+load_dotenv()
+
+from changes import UPSERT, record_changes, sequence_changes
+from db import create_db_engine
+from models import Game, Pricing, Sales
+from response_cache import invalidate_shared_cache
+from rollup import rebuild_rollup
+from versioning import bump_table_versions
+
+TABLES = {
+    "prices": (Pricing, ("game_id", "year", "price"), (int, int, float)),
+    "sales": (Sales, ("game_id", "year", "digital_sales", "hard_copy_sales"), (int, int, int, int)),
+}
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def read_rows(path, columns, types):
+    """
+    Yields the rows of a CSV or NDJSON file as tuples of typed values. Empty values
+    become None. Rows that cannot be converted are reported on stderr and skipped.
+    :param path: The path of the file; files ending in .ndjson or .jsonl are read as NDJSON.
+    :param columns: The column names to read.
+    :param types: The Python type of each column.
+    """
+    with open(path, newline="") as file:
+        if path.endswith((".ndjson", ".jsonl")):
+            records = (json.loads(line) for line in file if line.strip())
+        else:
+            records = csv.DictReader(file)
+
+        for line, record in enumerate(records, start=1):
+            try:
+                yield tuple(None if record.get(column) in (None, "") else cast(record[column])
+                            for column, cast in zip(columns, types))
+            except (TypeError, ValueError):
+                print(f"Skipping invalid record {line}: {record}", file=sys.stderr)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def copy_into_postgresql(connection, table, columns, rows, chunk_size):
+    """
+    Loads rows with COPY into a temporary staging table, then merges the staging
+    table into the target table and logs the merged rows in one statement.
+    :return: A tuple of the number of rows read and the number of rows merged.
+    """
+    column_list = ", ".join(columns)
+    value_columns = [column for column in columns if column not in ("game_id", "year")]
+    cursor = connection.connection.cursor()
+    cursor.execute(f"CREATE TEMP TABLE staging_{table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+
+    read = 0
+    for chunk in chunked(rows, chunk_size):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(chunk)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY staging_{table} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        read += len(chunk)
+
+    cursor.execute(
+        f"WITH merged AS ("
+        f"INSERT INTO {table} ({column_list}, updated_at) "
+        f"SELECT DISTINCT ON (game_id, year) {column_list}, now() FROM staging_{table} "
+        f"WHERE game_id IN (SELECT id FROM games) ORDER BY game_id, year "
+        f"ON CONFLICT (game_id, year) DO UPDATE SET "
+        + ", ".join(f"{column} = EXCLUDED.{column}" for column in value_columns + ["updated_at"])
+        + f" RETURNING game_id, year) "
+        f"INSERT INTO change_log (table_name, game_id, year, operation, changed_at) "
+        f"SELECT '{table}', game_id, year, '{UPSERT}', now() AT TIME ZONE 'utc' FROM merged")
+    return read, cursor.rowcount
+
+
+def upsert_into_sqlite(connection, model, columns, rows, chunk_size):
+    """
+    Upserts rows with one executemany per chunk.
+    :return: A tuple of the number of rows read and the number of rows written.
+    """
+    game_ids = set(connection.execute(select(Game.id)).scalars())
+    statement = sqlite_insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=["game_id", "year"],
+        set_={**{column: statement.excluded[column] for column in columns if column not in ("game_id", "year")},
+              "updated_at": func.now()})
+
+    read = written = 0
+    for chunk in chunked(rows, chunk_size):
+        read += len(chunk)
+        records = [dict(zip(columns, row)) for row in chunk if row[0] in game_ids]
+        if records:
+            connection.execute(statement, records)
+            keys = [(record["game_id"], record["year"]) for record in records]
+            record_changes(connection, model.__tablename__, keys, UPSERT)
+            written += len(records)
+
+    return read, written
+
+
+def load(engine, table, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Loads a file into the prices or sales table in one transaction.
+    :param engine: The engine of the database.
+    :param table: "prices" or "sales".
+    :param path: The path of the CSV or NDJSON file.
+    :param chunk_size: The number of rows sent to the database at a time.
+    :return: A tuple of the number of rows read and the number of rows written.
+    """
+    model, columns, types = TABLES[table]
+    rows = read_rows(path, columns, types)
+    backend = engine.url.get_backend_name()
+
+    with engine.begin() as connection:
+        if backend == "postgresql":
+            read, written = copy_into_postgresql(connection, table, columns, rows, chunk_size)
+        elif backend == "sqlite":
+            read, written = upsert_into_sqlite(connection, model, columns, rows, chunk_size)
+        else:
+            raise ValueError(f"Unsupported database backend: {backend}")
+
+        if written:
+            bump_table_versions(connection, (table,))
+            rebuild_rollup(connection)
+            sequence_changes(connection)
+
+    if written:
+        invalidate_shared_cache((table,))
+
+    return read, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load pricing or sales history.")
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("path", help="CSV file with a header row, or .ndjson/.jsonl file")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--database-url", help="defaults to AWS_POSTGRESQL_URL")
+    args = parser.parse_args()
+
+    engine = create_db_engine(args.database_url or os.getenv("AWS_POSTGRESQL_URL"))
+
+    start = time.perf_counter()
+    read, written = load(engine, args.table, args.path, args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    print(f"Loaded {written} of {read} rows into {args.table} in {elapsed:.2f}s "
+          f"({read / elapsed if elapsed else 0:,.0f} rows/sec); {read - written} skipped")
+
+
+if __name__ == "__main__":
+    main()
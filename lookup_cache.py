@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", 60))
+
+
+class LookupCache:
+    """
+    In-process name -> id cache for a small dimension table such as Developer,
+    Genre or Platform. The whole table is loaded lazily on first use and reloaded
+    once it is older than the TTL, so changes made by other workers are picked up.
+    Handlers that write to the table should call invalidate() after committing.
+    """
+
+    def __init__(self, model, ttl=LOOKUP_CACHE_TTL):
+        self.model = model
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids_by_name = {}
+        self._loaded_at = None
+
+    def refresh(self, session):
+        """
+        Reloads every name and id of the table.
+        :param session: The session used to query the table.
+        """
+        rows = session.query(self.model.id, self.model.name).all()
+
+        with self._lock:
+            self._ids_by_name = {name: row_id for row_id, name in rows}
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """Marks the cache as stale so the next lookup reloads the table."""
+        with self._lock:
+            self._loaded_at = None
+
+    def get_id(self, session, name):
+        """
+        Resolves a name to its id. A name missing from the cache is looked up in
+        the database once, since another worker may have added it since the last refresh.
+        :param session: The session used on a cache miss.
+        :param name: The name to resolve.
+        :return: The id, or None if no row has that name.
+        """
+        self._ensure_fresh(session)
+        row_id = self._ids_by_name.get(name)
+
+        if row_id is None:
+            row_id = session.query(self.model.id).filter(self.model.name == name).scalar()
+            if row_id is not None:
+                self._remember(row_id, name)
+
+        return row_id
+
+    def _ensure_fresh(self, session):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self.refresh(session)
+
+    def _remember(self, row_id, name):
+        with self._lock:
+            self._ids_by_name[name] = row_id
@@ -1,31 +1,170 @@
 import os
+import time
 
-from flask import Flask, jsonify, request
-from models import Developer, Genre, Platform, Game, Pricing, Sales
-from db import create_engine_and_session
+import click
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, send_file, stream_with_context, url_for
+from sqlalchemy import BigInteger, and_, cast, func, select, true, tuple_, union
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, load_only
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import date, datetime
 
+# The local modules below read their settings from the environment when imported, so .env is loaded before them
 load_dotenv()
-DATABASE_URL = os.getenv('AWS_POSTGRESQL_URL')
 
-session = create_engine_and_session(DATABASE_URL)
+import analytics
+from bulk_import import BulkImportError, import_games, read_records
+from changes import TRACKED_TABLES, UPSERT
+from compression import compress_response
+from fields import FieldsError, get_fields
+from json_provider import create_json_provider
+from lookup_cache import LookupCache
+from metrics import instrument_app, instrument_engine, render_metrics
+from pagination import PaginationError, decode_cursor, encode_cursor, get_page_size, paginate, paginate_by_position
+from response_cache import create_response_cache, init_response_cache
+from search import apply_search
+from snapshot import build_snapshots, read_manifest, snapshot_path
+from versioning import conditional
+from models import Developer, Genre, Platform, Game, Pricing, Sales, TrendRollup, TableVersion, ChangeLog
+import rollup  # noqa: F401 keeps trend_rollups in sync with every commit
+from db import create_scoped_session, init_db
+
+NDJSON_BATCH_SIZE = 1000
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+
+# The engine is created by the first request that uses the session, not on import
+session = create_scoped_session()
+
+# Tables each read endpoint depends on, used to validate conditional GETs
+DEVELOPER_TABLES = ("developers",)
+GENRE_TABLES = ("genres",)
+PLATFORM_TABLES = ("platforms",)
+GAME_TABLES = ("games", "developers", "genres", "platforms")
+PRICING_TABLES = ("prices", "games", "platforms")
+SALES_TABLES = ("sales", "games", "platforms")
+TREND_TABLES = ("sales", "prices", "games", "developers", "genres", "platforms")
+ANALYTICS_TABLES = ("sales", "prices", "games")
+TIMELINE_TABLES = ("games", "developers", "genres", "platforms", "prices", "sales")
+SALES_LEADERBOARD_TABLES = ("sales", "games", "developers", "genres", "platforms")
+PRICING_LEADERBOARD_TABLES = ("prices", "games", "developers", "genres", "platforms")
+MAX_ANALYTICS_GAMES = 10000
+MAX_BATCH_IDS = 1000
+DEFAULT_LEADERBOARD_TOP = 20
+MAX_LEADERBOARD_TOP = 100
+
+developer_cache = LookupCache(Developer)
+genre_cache = LookupCache(Genre)
+platform_cache = LookupCache(Platform)
+
+api = Blueprint("api", __name__, cli_group=None)
+
+
+@api.route('/')
+def home():
+    return 'APIVista Home Page'
 
-app = Flask(__name__)
 
+# Liveness probe: the worker is up, the database is not touched
+@api.route('/healthz')
+def healthz():
+    return jsonify(status="ok"), 200
 
-@app.route('/')
-def home():
-    return 'APIVista Home Page'
+
+# Readiness probe: the database is reachable and has been initialized with flask init-db
+@api.route('/readyz')
+def readyz():
+    try:
+        initialized = session.execute(select(TableVersion.name).limit(1)).first() is not None
+    except SQLAlchemyError as error:
+        return jsonify(status="unavailable", error=type(error).__name__), 503
+
+    if not initialized:
+        return jsonify(status="unavailable", error="Database is not initialized, run flask init-db"), 503
+
+    return jsonify(status="ok"), 200
+
+
+# Prometheus metrics of this worker process
+@api.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+# Create the tables, indexes and search index; safe to run on every deploy
+@api.cli.command("init-db")
+def init_db_command():
+    init_db(session.get_bind())
+    session.remove()
+    click.echo("Initialized the database.")
+
+
+# Serve GET requests from the read replica, unless the client needs to see its own recent writes
+def route_reads_to_replica():
+    if request.method in ("GET", "HEAD") and not request.headers.get(READ_YOUR_WRITES_HEADER):
+        session().use_replica()
+
+
+# Close the request's session so its connection returns to the pool, rolling back anything left uncommitted
+def remove_session(exception=None):
+    session.remove()
+
+
+@api.app_errorhandler(PaginationError)
+def handle_pagination_error(error):
+    return jsonify(error=str(error)), 400
+
+
+@api.app_errorhandler(FieldsError)
+def handle_fields_error(error):
+    return jsonify(error=str(error)), 400
+
+
+# Parse a comma separated list of integers, such as game ids or years, from the query string, or from args
+def get_int_list(name, required=False, args=None):
+    args = request.args if args is None else args
+
+    try:
+        values = sorted({int(value) for value in args.get(name, '').split(',') if value.strip()})
+    except ValueError:
+        raise ValueError(f"{name} must be a comma separated list of integers")
+
+    if required and not values:
+        raise ValueError(f"{name} is required")
+
+    if len(values) > MAX_BATCH_IDS:
+        raise ValueError(f"At most {MAX_BATCH_IDS} {name} can be requested at once")
+
+    return values
+
+
+# Stream every row of a query as newline-delimited JSON, reading it through a server-side cursor
+def stream_ndjson(query, to_dict):
+    def generate():
+        lines = []
+        try:
+            for row in query.yield_per(NDJSON_BATCH_SIZE):
+                lines.append(current_app.json.dumps(to_dict(row)) + "\n")
+                if len(lines) == NDJSON_BATCH_SIZE:
+                    yield "".join(lines)
+                    lines = []
+            if lines:
+                yield "".join(lines)
+        finally:
+            # The request's session is removed before the body is streamed, so the
+            # connection the query checked out has to be given back here.
+            query.session.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 # ============================ DEVELOPERS START =====================================
 
 # Getting all Developers
-@app.route('/api/developer')
+@api.route('/api/developer')
+@conditional(session, DEVELOPER_TABLES)
 def get_all_developers():
     developers = []
-    results = session.query(Developer).all()
+    results, next_cursor = paginate(session.query(Developer), (Developer.id,))
     for developer in results:
         dev_id = developer.id
         name = developer.name
@@ -33,11 +172,12 @@ def get_all_developers():
             "id": dev_id,
             "name": name
         })
-    return jsonify(developers=developers), 200
+    return jsonify(developers=developers, next_cursor=next_cursor), 200
 
 
 # Get a single Developer
-@app.route('/api/developer/<int:developer_id>', methods=['GET'])
+@api.route('/api/developer/<int:developer_id>', methods=['GET'])
+@conditional(session, DEVELOPER_TABLES)
 def get_single_developer(developer_id):
     developer = session.query(Developer).filter(Developer.id == developer_id).scalar()
 
@@ -53,7 +193,7 @@ def get_single_developer(developer_id):
 
 
 # Adding a Developer
-@app.route('/api/developer', methods=['POST'])
+@api.route('/api/developer', methods=['POST'])
 def add_developer():
     """
     Add a new developer.
@@ -71,11 +211,12 @@ def add_developer():
     new_developer = Developer(name=name)
     session.add(new_developer)
     session.commit()
+    developer_cache.invalidate()
     return jsonify(message="Successfully added the new Developer"), 200
 
 
 # Update a Developer
-@app.route("/api/developer/<int:developer_id>", methods=['PATCH'])
+@api.route("/api/developer/<int:developer_id>", methods=['PATCH'])
 def update_developer(developer_id):
     new_name = request.args.get('name')
     developer = session.query(Developer).filter(Developer.id == developer_id).scalar()
@@ -85,11 +226,12 @@ def update_developer(developer_id):
 
     developer.name = new_name
     session.commit()
+    developer_cache.invalidate()
     return jsonify(message="Successfully Updated the Developer"), 200
 
 
 # Deleting a developer
-@app.route('/api/developer/<int:developer_id>', methods=['DELETE'])
+@api.route('/api/developer/<int:developer_id>', methods=['DELETE'])
 def delete_developer(developer_id):
     developer = session.query(Developer).filter(Developer.id == developer_id).scalar()
 
@@ -98,6 +240,7 @@ def delete_developer(developer_id):
 
     session.delete(developer)
     session.commit()
+    developer_cache.invalidate()
     return jsonify(message="Successfully Deleted the Developer"), 200
 
 
@@ -107,10 +250,11 @@ def delete_developer(developer_id):
 # ============================ GENRES START =====================================
 
 # Getting all Genres
-@app.route('/api/genre')
+@api.route('/api/genre')
+@conditional(session, GENRE_TABLES)
 def get_all_genres():
     genres = []
-    results = session.query(Genre).all()
+    results, next_cursor = paginate(session.query(Genre), (Genre.id,))
     for genre in results:
         genre_id = genre.id
         name = genre.name
@@ -118,11 +262,12 @@ def get_all_genres():
             "id": genre_id,
             "name": name
         })
-    return jsonify(genres=genres), 200
+    return jsonify(genres=genres, next_cursor=next_cursor), 200
 
 
 # Get a single Genre
-@app.route('/api/genre/<int:genre_id>', methods=['GET'])
+@api.route('/api/genre/<int:genre_id>', methods=['GET'])
+@conditional(session, GENRE_TABLES)
 def get_single_genre(genre_id):
     genre = session.query(Genre).filter(Genre.id == genre_id).scalar()
 
@@ -138,7 +283,7 @@ def get_single_genre(genre_id):
 
 
 # Adding a Genre
-@app.route('/api/genre', methods=['POST'])
+@api.route('/api/genre', methods=['POST'])
 def add_genre():
     name = request.args.get('name')
 
@@ -150,11 +295,12 @@ def add_genre():
     new_genre = Genre(name=name)
     session.add(new_genre)
     session.commit()
+    genre_cache.invalidate()
     return jsonify(message="Successfully added the new Genre"), 200
 
 
 # Update a Genre
-@app.route("/api/genre/<int:genre_id>", methods=['PATCH'])
+@api.route("/api/genre/<int:genre_id>", methods=['PATCH'])
 def update_genre(genre_id):
     new_name = request.args.get('name')
     genre = session.query(Genre).filter(Genre.id == genre_id).scalar()
@@ -164,11 +310,12 @@ def update_genre(genre_id):
 
     genre.name = new_name
     session.commit()
+    genre_cache.invalidate()
     return jsonify(message="Successfully Updated the Genre"), 200
 
 
 # Deleting a Genre
-@app.route('/api/genre/<int:genre_id>', methods=['DELETE'])
+@api.route('/api/genre/<int:genre_id>', methods=['DELETE'])
 def delete_genre(genre_id):
     genre = session.query(Genre).filter(Genre.id == genre_id).scalar()
 
@@ -177,6 +324,7 @@ def delete_genre(genre_id):
 
     session.delete(genre)
     session.commit()
+    genre_cache.invalidate()
     return jsonify(message="Successfully Deleted the Genre"), 200
 
 
@@ -185,20 +333,22 @@ def delete_genre(genre_id):
 # ============================ PLATFORM START =======================================
 
 # Getting all Platforms
-@app.route('/api/platform')
+@api.route('/api/platform')
+@conditional(session, PLATFORM_TABLES)
 def get_all_platform():
     platforms = []
-    results = session.query(Platform).all()
+    results, next_cursor = paginate(session.query(Platform), (Platform.id,))
     for platform in results:
         platforms.append({
             "id": platform.id,
             "name": platform.name
         })
-    return jsonify(platforms=platforms), 200
+    return jsonify(platforms=platforms, next_cursor=next_cursor), 200
 
 
 # Get a single Platform
-@app.route('/api/platform/<int:platform_id>', methods=['GET'])
+@api.route('/api/platform/<int:platform_id>', methods=['GET'])
+@conditional(session, PLATFORM_TABLES)
 def get_single_platform(platform_id):
     platform = session.query(Platform).filter(Platform.id == platform_id).scalar()
 
@@ -214,7 +364,7 @@ def get_single_platform(platform_id):
 
 
 # Adding a Platform
-@app.route('/api/platform', methods=['POST'])
+@api.route('/api/platform', methods=['POST'])
 def add_platform():
     name = request.args.get('name')
 
@@ -226,11 +376,12 @@ def add_platform():
     new_platform = Platform(name=name)
     session.add(new_platform)
     session.commit()
+    platform_cache.invalidate()
     return jsonify(message="Successfully added the new Platform"), 200
 
 
 # Update a Platform
-@app.route("/api/platform/<int:platform_id>", methods=['PATCH'])
+@api.route("/api/platform/<int:platform_id>", methods=['PATCH'])
 def update_platform(platform_id):
     new_name = request.args.get('name')
     platform = session.query(Platform).filter(Platform.id == platform_id).scalar()
@@ -240,11 +391,12 @@ def update_platform(platform_id):
 
     platform.name = new_name
     session.commit()
+    platform_cache.invalidate()
     return jsonify(message="Successfully Updated the Platform"), 200
 
 
 # Deleting a Platform
-@app.route('/api/platform/<int:platform_id>', methods=['DELETE'])
+@api.route('/api/platform/<int:platform_id>', methods=['DELETE'])
 def delete_platform(platform_id):
     platform = session.query(Platform).filter(Platform.id == platform_id).scalar()
 
@@ -253,6 +405,7 @@ def delete_platform(platform_id):
 
     session.delete(platform)
     session.commit()
+    platform_cache.invalidate()
     return jsonify(message="Successfully Deleted the Platform"), 200
 
 
@@ -260,62 +413,209 @@ def delete_platform(platform_id):
 
 # ============================ GAME START =======================================
 
-# Get all Games
-@app.route('/api/game')
+# Response fields of a Game read straight from its columns
+GAME_COLUMN_FIELDS = ("id", "title", "release_date", "description", "gameplay_modes", "img_url")
+
+# Response fields of a Game holding the name of a related row, with the relationship and column they come from
+GAME_NAME_FIELDS = {
+    "developer": (Game.developer, Developer.name),
+    "genre": (Game.genre, Genre.name),
+    "platform_id": (Game.platform, Platform.name)
+}
+
+GAME_FIELDS = GAME_COLUMN_FIELDS + tuple(GAME_NAME_FIELDS)
+
+
+# Serialize the requested fields of a Game loaded by query_games_with_names
+def game_to_dict(game, fields=GAME_FIELDS):
+    row = {}
+    for field in fields:
+        if field in GAME_NAME_FIELDS:
+            row[field] = getattr(game, GAME_NAME_FIELDS[field][0].key).name
+        else:
+            row[field] = getattr(game, field)
+    return row
+
+
+# Query for Games loading only the requested columns, with the requested developer, genre and platform names
+# joined in the same SELECT. key_columns are loaded as well so pagination can build its cursor. Pass
+# build=select to get a statement for an AsyncSession instead of a Query.
+def query_games_with_names(fields=GAME_FIELDS, key_columns=(), build=session.query):
+    columns = [getattr(Game, field) for field in fields if field in GAME_COLUMN_FIELDS]
+    options = [load_only(Game.id, *columns, *key_columns, raiseload=True)]
+
+    for field in fields:
+        if field in GAME_NAME_FIELDS:
+            relationship, name = GAME_NAME_FIELDS[field]
+            options.append(joinedload(relationship, innerjoin=True).load_only(name))
+
+    return build(Game).options(*options)
+
+
+# Columns the game listing can be sorted by, each paired with the id as a tie-breaker
+GAME_SORTS = {
+    "id": (Game.id,),
+    "title": (Game.title, Game.id),
+    "release_date": (Game.release_date, Game.id)
+}
+
+
+# Columns the game listing can be filtered on by name, each with the cache that resolves the name to an id
+GAME_NAME_FILTERS = (("platform", platform_cache, Game.platform_id),
+                     ("genre", genre_cache, Game.genre_id),
+                     ("developer", developer_cache, Game.developer_id))
+
+
+# Read the sort query argument of the game listing, or of args, as its key columns and whether it is descending
+def get_game_sort(args=None):
+    args = request.args if args is None else args
+    sort = args.get('sort', 'id')
+
+    if sort.lstrip('-') not in GAME_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(GAME_SORTS)}, prefixed with - for descending")
+
+    return GAME_SORTS[sort.lstrip('-')], sort.startswith('-')
+
+
+# Limit a game listing query to the released_from and released_to query arguments, or those of args
+def filter_release_dates(query, args=None):
+    args = request.args if args is None else args
+
+    try:
+        released_from = args.get('released_from')
+        released_to = args.get('released_to')
+        if released_from:
+            query = query.filter(Game.release_date >= date.fromisoformat(released_from))
+        if released_to:
+            query = query.filter(Game.release_date <= date.fromisoformat(released_to))
+    except ValueError:
+        raise ValueError("released_from and released_to must be dates like 2020-01-31")
+
+    return query
+
+
+# Get all Games, optionally filtered by platform, genre, developer and release date range
+@api.route('/api/game')
+@conditional(session, GAME_TABLES)
 def get_all_games():
-    games = []
-    results = session.query(Game).order_by(Game.id).all()
-
-    for game in results:
-        developer_name = session.query(Developer.name).filter(Developer.id == game.developer_id).scalar()
-        genre = session.query(Genre.name).filter(Genre.id == game.genre_id).scalar()
-        platform = session.query(Platform.name).filter(Platform.id == game.platform_id).scalar()
-
-        games.append({
-            "id": game.id,
-            "title": game.title,
-            "release_date": game.release_date,
-            "description": game.description,
-            "gameplay_modes": game.gameplay_modes,
-            "img_url": game.img_url,
-            "developer": developer_name,
-            "genre": genre,
-            "platform_id": platform
-        })
+    fields = get_fields(GAME_FIELDS)
+
+    try:
+        key_columns, descending = get_game_sort()
+        query = filter_release_dates(query_games_with_names(fields, key_columns))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+
+    for dimension, cache, column in GAME_NAME_FILTERS:
+        name = request.args.get(dimension)
+        if name:
+            dimension_id = cache.get_id(session, name)
+            if not dimension_id:
+                return jsonify(error=f"{dimension.capitalize()} not found"), 404
+            query = query.filter(column == dimension_id)
+
+    results, next_cursor = paginate(query, key_columns, descending=descending)
+    games = [game_to_dict(game, fields) for game in results]
+
+    return jsonify(games=games, next_cursor=next_cursor), 200
+
+
+# Get several Games by id in one query
+@api.route('/api/game/batch')
+@conditional(session, GAME_TABLES)
+def get_games_batch():
+    fields = get_fields(GAME_FIELDS)
 
-    return jsonify(games=games), 200
+    try:
+        game_ids = get_int_list('ids', required=True)
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+
+    results = query_games_with_names(fields).filter(Game.id.in_(game_ids)).order_by(Game.id).all()
+    games = [game_to_dict(game, fields) for game in results]
+    missing = sorted(set(game_ids) - {game.id for game in results})
+
+    return jsonify(games=games, missing=missing), 200
 
 
 # Get a single Game
-@app.route('/api/game/<int:game_id>', methods=['GET'])
+@api.route('/api/game/<int:game_id>', methods=['GET'])
+@conditional(session, GAME_TABLES)
 def get_single_game(game_id):
-    game = []
-    found_game = session.query(Game).filter(Game.id == game_id).scalar()
+    fields = get_fields(GAME_FIELDS)
+    found_game = query_games_with_names(fields).filter(Game.id == game_id).scalar()
 
     if not found_game:
         return jsonify(error="Game not found"), 404
 
-    developer_name = session.query(Developer.name).filter(Developer.id == found_game.id).scalar()
-    genre = session.query(Genre.name).filter(Genre.id == found_game.genre_id).scalar()
-    platform = session.query(Platform.name).filter(Platform.id == found_game.platform_id).scalar()
-
-    game.append({
-        "id": found_game.id,
-        "title": found_game.title,
-        "release_date": found_game.release_date,
-        "description": found_game.description,
-        "gameplay_modes": found_game.gameplay_modes,
-        "img_url": found_game.img_url,
-        "developer": developer_name,
-        "genre": genre,
-        "platform_id": platform
-    })
+    game = [game_to_dict(found_game, fields)]
 
     return jsonify(game=game), 200
 
 
+# Select a Game's fields with every year of its pricing and sales, aligned by year, in one statement
+def select_game_timeline(game_id):
+    years = union(select(Pricing.year).where(Pricing.game_id == game_id),
+                  select(Sales.year).where(Sales.game_id == game_id)).subquery()
+
+    # Left join the years so a game without any history still returns its row
+    return select(Game.id, Game.title, Game.release_date, Game.description, Game.gameplay_modes, Game.img_url,
+                  Developer.name.label("developer"), Genre.name.label("genre"), Platform.name.label("platform_id"),
+                  years.c.year, Pricing.price, Sales.digital_sales, Sales.hard_copy_sales) \
+        .join(Developer, Developer.id == Game.developer_id) \
+        .join(Genre, Genre.id == Game.genre_id) \
+        .join(Platform, Platform.id == Game.platform_id) \
+        .outerjoin(years, true()) \
+        .outerjoin(Pricing, and_(Pricing.game_id == Game.id, Pricing.year == years.c.year)) \
+        .outerjoin(Sales, and_(Sales.game_id == Game.id, Sales.year == years.c.year)) \
+        .where(Game.id == game_id) \
+        .order_by(years.c.year)
+
+
+# Split the rows of select_game_timeline into the Game and its list of years
+def game_timeline_to_dict(rows):
+    game = {field: getattr(rows[0], field) for field in GAME_FIELDS}
+    timeline = [{
+        "year": row.year,
+        "price": row.price,
+        "digital_sales": row.digital_sales,
+        "hard_copy_sales": row.hard_copy_sales
+    } for row in rows if row.year is not None]
+
+    return {"game": game, "timeline": timeline}
+
+
+# Get a Game with every year of its pricing and sales, aligned by year, in one query
+@api.route('/api/game/<int:game_id>/timeline', methods=['GET'])
+@conditional(session, TIMELINE_TABLES)
+def get_game_timeline(game_id):
+    rows = session.execute(select_game_timeline(game_id)).all()
+
+    if not rows:
+        return jsonify(error="Game not found"), 404
+
+    return jsonify(game_timeline_to_dict(rows)), 200
+
+
+# Search Games by title and description, best matches first
+@api.route('/api/game/search')
+@conditional(session, GAME_TABLES)
+def search_games():
+    terms = request.args.get('q', '').strip()
+
+    if not terms:
+        return jsonify(error="q must not be empty"), 400
+
+    fields = get_fields(GAME_FIELDS)
+    query = apply_search(query_games_with_names(fields), session.get_bind().dialect.name, terms)
+    results, next_cursor = paginate_by_position(query)
+    games = [game_to_dict(game, fields) for game in results]
+
+    return jsonify(games=games, next_cursor=next_cursor), 200
+
+
 # Add a Game
-@app.route('/api/game', methods=['POST'])
+@api.route('/api/game', methods=['POST'])
 def add_game():
     title = request.args.get('title')
     description = request.args.get('description')
@@ -326,30 +626,30 @@ def add_game():
     genre_name = request.args.get('genre')
     platform_name = request.args.get('platform')
 
-    platform = session.query(Platform).filter(Platform.name == platform_name).scalar()
+    platform_id = platform_cache.get_id(session, platform_name)
 
-    if not platform:
+    if not platform_id:
         return jsonify(error="Platform does not exist, please add the Platform to the database"), 404
 
-    existing_game = session.query(Game).filter(Game.title == title, Game.platform_id == platform.id).scalar()
+    existing_game = session.query(Game).filter(Game.title == title, Game.platform_id == platform_id).scalar()
 
     if existing_game:
         return jsonify(error="Game already exists for this platform."), 409
 
-    developer = session.query(Developer).filter(Developer.name == developer_name).scalar()
+    developer_id = developer_cache.get_id(session, developer_name)
 
-    if not developer:
+    if not developer_id:
         return jsonify(error="Developer does not exist, please add the developer to the database"), 404
 
-    genre = session.query(Genre).filter(Genre.name == genre_name).scalar()
+    genre_id = genre_cache.get_id(session, genre_name)
 
-    if not genre:
+    if not genre_id:
         return jsonify(error="Genre does not exist, please add the Genre to the database"), 404
 
     release_date = datetime.strptime(release_date_str, '%B/%d/%Y').date()
 
     new_game = Game(title=title, description=description, release_date=release_date, gameplay_modes=gameplay_modes,
-                    img_url=img_url, developer_id=developer.id, genre_id=genre.id, platform_id=platform.id)
+                    img_url=img_url, developer_id=developer_id, genre_id=genre_id, platform_id=platform_id)
 
     session.add(new_game)
     session.commit()
@@ -357,8 +657,22 @@ def add_game():
     return jsonify(message="Successfully added the Game"), 200
 
 
+# Add many Games from a JSON array or CSV body in one transaction
+@api.route('/api/game/bulk', methods=['POST'])
+def add_games_bulk():
+    try:
+        records = read_records(request)
+    except BulkImportError as error:
+        return jsonify(error=str(error)), 400
+
+    inserted, errors = import_games(session, records)
+    session.commit()
+
+    return jsonify(message=f"Successfully added {inserted} Games", inserted=inserted, errors=errors), 200
+
+
 # Update a Game
-@app.route('/api/game/<int:game_id>', methods=['PATCH'])
+@api.route('/api/game/<int:game_id>', methods=['PATCH'])
 def update_game(game_id):
     game = session.query(Game).filter(Game.id == game_id).scalar()
 
@@ -380,7 +694,7 @@ def update_game(game_id):
 
 
 # Delete a Game
-@app.route('/api/game/<int:game_id>', methods=['DELETE'])
+@api.route('/api/game/<int:game_id>', methods=['DELETE'])
 def delete_game(game_id):
     game = session.query(Game).filter(Game.id == game_id).scalar()
 
@@ -397,50 +711,99 @@ def delete_game(game_id):
 
 # ============================ PRICING START =======================================
 
+# Query the requested fields of a prices or sales table, joining games and platforms only when a title or
+# platform name is requested. The game_id and year keys are always selected for pagination. Pass
+# build=select to get a statement for an AsyncSession instead of a Query.
+def query_with_game_names(model, fields, build=session.query):
+    columns = [model.game_id, model.year]
+    columns += [getattr(model, field) for field in fields if field not in ("platform", "title", "year")]
+
+    if "title" in fields:
+        columns.append(Game.title)
+    if "platform" in fields:
+        columns.append(Platform.name.label("platform"))
+
+    query = build(*columns)
+
+    if "title" in fields or "platform" in fields:
+        query = query.join(Game, Game.id == model.game_id)
+    if "platform" in fields:
+        query = query.join(Platform, Platform.id == Game.platform_id)
+
+    return query
+
+
+PRICING_FIELDS = ("platform", "title", "year", "price")
+
+
+def pricing_to_dict(pricing, fields=PRICING_FIELDS):
+    return {field: getattr(pricing, field) for field in fields}
+
+
 # Getting all Pricing information
-@app.route('/api/pricing')
+@api.route('/api/pricing')
+@conditional(session, PRICING_TABLES)
 def get_all_pricing():
-    all_prices = []
-    results = session.query(Pricing).all()
+    fields = get_fields(PRICING_FIELDS)
+    query = query_with_game_names(Pricing, fields)
+
+    if request.args.get('format') == 'ndjson':
+        return stream_ndjson(query.order_by(Pricing.game_id, Pricing.year),
+                             lambda pricing: pricing_to_dict(pricing, fields))
 
-    for pricing in results:
-        game = session.query(Game).filter(Game.id == pricing.game_id).first()
-        platform = session.query(Platform).filter(Platform.id == game.id).scalar()
+    results, next_cursor = paginate(query, (Pricing.game_id, Pricing.year))
+    all_prices = [pricing_to_dict(pricing, fields) for pricing in results]
 
-        if game:
-            all_prices.append({
-                "platform": platform.name,
-                "title": game.title,
-                "year": pricing.year,
-                "price": pricing.price
-            })
+    return jsonify(pricings=all_prices, next_cursor=next_cursor), 200
+
+
+# Get Pricing for several Games, optionally limited to some years, in one query
+@api.route('/api/pricing/batch')
+@conditional(session, PRICING_TABLES)
+def get_pricing_batch():
+    fields = get_fields(PRICING_FIELDS)
+
+    try:
+        game_ids = get_int_list('game_ids', required=True)
+        years = get_int_list('years')
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+
+    query = query_with_game_names(Pricing, fields).filter(Pricing.game_id.in_(game_ids))
+    if years:
+        query = query.filter(Pricing.year.in_(years))
+
+    all_prices = [{"game_id": pricing.game_id, **pricing_to_dict(pricing, fields)}
+                  for pricing in query.order_by(Pricing.game_id, Pricing.year)]
 
     return jsonify(pricings=all_prices), 200
 
 
 # Get Pricing for a single Game
-@app.route('/api/pricing/<int:game_id>', methods=['GET'])
+@api.route('/api/pricing/<int:game_id>', methods=['GET'])
+@conditional(session, PRICING_TABLES)
 def get_single_game_pricing(game_id):
     year = request.args.get('year')
-    pricing = session.query(Pricing).filter_by(game_id=game_id, year=year).first()
-    platform = session.query(Platform).filter(Platform.id == game_id).scalar()
-    game = session.query(Game).filter(Game.id == game_id).scalar()
+
+    try:
+        year = None if year is None else int(year)
+    except ValueError:
+        return jsonify(error="year must be an integer"), 400
+
+    fields = get_fields(PRICING_FIELDS)
+    pricing = query_with_game_names(Pricing, fields) \
+        .filter(Pricing.game_id == game_id, Pricing.year == year).first()
 
     if not pricing:
         return jsonify(error="Pricing information not found for the specified game and year"), 404
 
-    pricing_info = [{
-        "platform": platform.name,
-        "title": game.title,
-        "year": pricing.year,
-        "price": pricing.price
-    }]
+    pricing_info = [pricing_to_dict(pricing, fields)]
 
     return jsonify(pricing=pricing_info), 200
 
 
 # Add Pricing for a Game
-@app.route('/api/pricing/<int:game_id>', methods=['POST'])
+@api.route('/api/pricing/<int:game_id>', methods=['POST'])
 def add_game_pricing(game_id):
     price = request.args.get('price')
     year = request.args.get('year')
@@ -463,7 +826,7 @@ def add_game_pricing(game_id):
 
 
 # Update Pricing for a Game
-@app.route('/api/pricing/<int:game_id>', methods=['PATCH'])
+@api.route('/api/pricing/<int:game_id>', methods=['PATCH'])
 def update_game_pricing_or_year(game_id):
     new_price = request.args.get('price')
     new_year = request.args.get('year')
@@ -480,10 +843,11 @@ def update_game_pricing_or_year(game_id):
     return jsonify(message="Successfully updated pricing information for the Game"), 200
 
 
-# Delete Pricing for a Game
-@app.route('/api/pricing/<int:game_id>', methods=['DELETE'])
+# Delete Pricing for a Game at a specific Year
+@api.route('/api/pricing/<int:game_id>', methods=['DELETE'])
 def delete_game_pricing(game_id):
-    pricing = session.query(Pricing).filter(Pricing.game_id == game_id).scalar()
+    year = request.args.get('year')
+    pricing = session.query(Pricing).filter(Pricing.game_id == game_id, Pricing.year == year).first()
 
     if not pricing:
         return jsonify(error="Pricing information not found for the specified game and year"), 404
@@ -499,53 +863,75 @@ def delete_game_pricing(game_id):
 
 # ============================ SALES START =======================================
 
+SALES_FIELDS = ("platform", "title", "year", "digital_sales", "hard_copy_sales")
+
+
+def sales_to_dict(sale, fields=SALES_FIELDS):
+    return {field: getattr(sale, field) for field in fields}
+
+
 # Getting all Sales information
-@app.route('/api/sales')
+@api.route('/api/sales')
+@conditional(session, SALES_TABLES)
 def get_all_sales():
-    all_sales = []
-    results = session.query(Sales).all()
-
-    for sale in results:
-        game = session.query(Game).filter(Game.id == sale.game_id).first()
-        platform = session.query(Platform).filter(Platform.id == game.platform_id).first()
-
-        if game:
-            all_sales.append({
-                "platform": platform.name,
-                "title": game.title,
-                "year": sale.year,
-                "digital_sales": sale.digital_sales,
-                "hard_copy_sales": sale.hard_copy_sales
-            })
+    fields = get_fields(SALES_FIELDS)
+    query = query_with_game_names(Sales, fields)
+
+    if request.args.get('format') == 'ndjson':
+        return stream_ndjson(query.order_by(Sales.game_id, Sales.year), lambda sale: sales_to_dict(sale, fields))
+
+    results, next_cursor = paginate(query, (Sales.game_id, Sales.year))
+    all_sales = [sales_to_dict(sale, fields) for sale in results]
+
+    return jsonify(sales=all_sales, next_cursor=next_cursor), 200
+
+
+# Get Sales for several Games, optionally limited to some years, in one query
+@api.route('/api/sales/batch')
+@conditional(session, SALES_TABLES)
+def get_sales_batch():
+    fields = get_fields(SALES_FIELDS)
+
+    try:
+        game_ids = get_int_list('game_ids', required=True)
+        years = get_int_list('years')
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+
+    query = query_with_game_names(Sales, fields).filter(Sales.game_id.in_(game_ids))
+    if years:
+        query = query.filter(Sales.year.in_(years))
+
+    all_sales = [{"game_id": sale.game_id, **sales_to_dict(sale, fields)}
+                 for sale in query.order_by(Sales.game_id, Sales.year)]
 
     return jsonify(sales=all_sales), 200
 
 
 # Get Sales for a single Game
-@app.route('/api/sales/<int:game_id>', methods=['GET'])
+@api.route('/api/sales/<int:game_id>', methods=['GET'])
+@conditional(session, SALES_TABLES)
 def get_single_game_sales(game_id):
     year = request.args.get('year')
-    sales = session.query(Sales).filter_by(game_id=game_id, year=year).first()
+
+    try:
+        year = None if year is None else int(year)
+    except ValueError:
+        return jsonify(error="year must be an integer"), 400
+
+    fields = get_fields(SALES_FIELDS)
+    sales = query_with_game_names(Sales, fields).filter(Sales.game_id == game_id, Sales.year == year).first()
 
     if not sales:
         return jsonify(error="Sales information not found for the specified game and year"), 404
 
-    game = session.query(Game).filter(Game.id == game_id).scalar()
-    platform = session.query(Platform).filter(Platform.id == game.platform_id).first()
-
-    sales_info = [{
-        "platform": platform.name,
-        "title": game.title,
-        "year": sales.year,
-        "digital_sales": sales.digital_sales,
-        "hard_copy_sales": sales.hard_copy_sales
-    }]
+    sales_info = [sales_to_dict(sales, fields)]
 
     return jsonify(sales=sales_info), 200
 
 
 # Add Sales for a Game
-@app.route('/api/sales/<int:game_id>', methods=['POST'])
+@api.route('/api/sales/<int:game_id>', methods=['POST'])
 def add_game_sales(game_id):
     digital_sales = request.args.get('digital_sales')
     hard_copy_sales = request.args.get('hard_copy_sales')
@@ -569,13 +955,13 @@ def add_game_sales(game_id):
 
 
 # Update Sales for a Game
-@app.route('/api/sales/<int:game_id>', methods=['PATCH'])
+@api.route('/api/sales/<int:game_id>', methods=['PATCH'])
 def update_game_sales_or_year(game_id):
     new_digital_sales = request.args.get('digital_sales')
     new_hard_copy_sales = request.args.get('hard_copy_sales')
     new_year = request.args.get('year')
 
-    sales = session.query(Sales).filter(Sales.game_id == game_id).first()
+    sales = session.query(Sales).filter(Sales.game_id == game_id, Sales.year == new_year).first()
 
     if not sales:
         return jsonify(error="Sales information not found for the specified game and year"), 404
@@ -589,7 +975,7 @@ def update_game_sales_or_year(game_id):
 
 
 # Delete Sales for a Game at a specific Year
-@app.route('/api/sales/<int:game_id>', methods=['DELETE'])
+@api.route('/api/sales/<int:game_id>', methods=['DELETE'])
 def delete_game_sales(game_id):
     year = request.args.get('year')
     sales = session.query(Sales).filter(Sales.game_id == game_id, Sales.year == year).first()
@@ -605,6 +991,429 @@ def delete_game_sales(game_id):
 
 # ============================ SALES END =======================================
 
+
+# ============================ TRENDS START =======================================
+
+# Dimensions trends can be grouped by, with the model holding their names
+TREND_DIMENSIONS = {
+    "year": (TrendRollup.year, None),
+    "platform": (TrendRollup.platform_id, Platform),
+    "genre": (TrendRollup.genre_id, Genre),
+    "developer": (TrendRollup.developer_id, Developer)
+}
+
+
+# Get sales totals and average price grouped by any of year, platform, genre and developer
+@api.route('/api/trends')
+@conditional(session, TREND_TABLES)
+def get_trends():
+    group_by = request.args.get('group_by', 'year,platform,genre,developer').split(',')
+
+    if not set(group_by) <= set(TREND_DIMENSIONS):
+        return jsonify(error=f"group_by must be a comma separated list of {', '.join(TREND_DIMENSIONS)}"), 400
+
+    group_by = [dimension for dimension in TREND_DIMENSIONS if dimension in group_by]
+    key_columns = [TREND_DIMENSIONS[dimension][0] for dimension in group_by]
+    columns = list(key_columns)
+    joins = []
+
+    for dimension in group_by:
+        column, model = TREND_DIMENSIONS[dimension]
+        if model is not None:
+            columns.append(model.name.label(dimension))
+            joins.append((model, model.id == column))
+
+    query = session.query(
+        *columns,
+        cast(func.sum(TrendRollup.digital_sales), BigInteger).label("digital_sales"),
+        cast(func.sum(TrendRollup.hard_copy_sales), BigInteger).label("hard_copy_sales"),
+        (func.sum(TrendRollup.price_total) / func.nullif(func.sum(TrendRollup.price_count), 0)).label("average_price")
+    )
+
+    for model, condition in joins:
+        query = query.join(model, condition)
+
+    if request.args.get('year'):
+        try:
+            query = query.filter(TrendRollup.year == int(request.args.get('year')))
+        except ValueError:
+            return jsonify(error="year must be an integer"), 400
+
+    for dimension, cache in (("platform", platform_cache), ("genre", genre_cache), ("developer", developer_cache)):
+        name = request.args.get(dimension)
+        if name:
+            dimension_id = cache.get_id(session, name)
+            if not dimension_id:
+                return jsonify(error=f"{dimension.capitalize()} not found"), 404
+            query = query.filter(TREND_DIMENSIONS[dimension][0] == dimension_id)
+
+    query = query.group_by(*columns)
+    results, next_cursor = paginate(query, key_columns)
+
+    trends = [{
+        **{dimension: getattr(row, dimension) for dimension in group_by},
+        "digital_sales": row.digital_sales,
+        "hard_copy_sales": row.hard_copy_sales,
+        "average_price": row.average_price
+    } for row in results]
+
+    return jsonify(trends=trends, next_cursor=next_cursor), 200
+
+
+# ============================ TRENDS END =======================================
+
+
+# ============================ LEADERBOARDS START =======================================
+
+# Dimensions leaderboards can be partitioned by, with the column of the ranked row and the model holding their names.
+# The year column is the one of the ranked table.
+LEADERBOARD_PARTITIONS = {
+    "year": (None, None),
+    "platform": (Game.platform_id, Platform),
+    "genre": (Game.genre_id, Genre),
+    "developer": (Game.developer_id, Developer)
+}
+
+# Values sales leaderboards can rank games by
+SALES_LEADERBOARD_METRICS = {
+    "sales": func.coalesce(Sales.digital_sales, 0) + func.coalesce(Sales.hard_copy_sales, 0),
+    "digital_sales": Sales.digital_sales,
+    "hard_copy_sales": Sales.hard_copy_sales
+}
+
+
+# Rank the games of every partition by value, highest first, with a row_number() window in one query, and return
+# a page of the top games of each partition. Unless years are ranked within or filtered, each game is ranked once by
+# aggregate(value) over all of its years.
+def get_leaderboard(model, value, value_name, aggregate):
+    by = [dimension for dimension in request.args.get('by', 'year').split(',') if dimension]
+
+    if not set(by) <= set(LEADERBOARD_PARTITIONS):
+        return jsonify(error=f"by must be a comma separated list of {', '.join(LEADERBOARD_PARTITIONS)}"), 400
+
+    try:
+        top = int(request.args.get('top', DEFAULT_LEADERBOARD_TOP))
+    except ValueError:
+        top = 0
+
+    if not 1 <= top <= MAX_LEADERBOARD_TOP:
+        return jsonify(error=f"top must be an integer from 1 to {MAX_LEADERBOARD_TOP}"), 400
+
+    year = request.args.get('year')
+
+    try:
+        year = int(year) if year else None
+    except ValueError:
+        return jsonify(error="year must be an integer"), 400
+
+    if "year" in by or year is not None:
+        values = session.query(model.game_id, model.year, value.label("value")).filter(value.isnot(None))
+        if year is not None:
+            values = values.filter(model.year == year)
+    else:
+        values = session.query(model.game_id, aggregate(value).label("value")) \
+            .filter(value.isnot(None)).group_by(model.game_id)
+
+    values = values.subquery()
+    partitions = {dimension: values.c.year if dimension == "year" else LEADERBOARD_PARTITIONS[dimension][0]
+                  for dimension in LEADERBOARD_PARTITIONS if dimension in by}
+    # Years are keys and names at once; the other partitions are keyed by id and named with a join
+    partition_keys = {dimension: dimension if dimension == "year" else f"{dimension}_id" for dimension in partitions}
+    ranked = session.query(
+        values.c.game_id,
+        Game.title,
+        *[column.label(partition_keys[dimension]) for dimension, column in partitions.items()],
+        values.c.value,
+        func.row_number().over(partition_by=list(partitions.values()) or None,
+                               order_by=(values.c.value.desc(), values.c.game_id)).label("rank")
+    ).join(Game, Game.id == values.c.game_id)
+
+    for dimension, cache in (("platform", platform_cache), ("genre", genre_cache), ("developer", developer_cache)):
+        name = request.args.get(dimension)
+        if name:
+            dimension_id = cache.get_id(session, name)
+            if not dimension_id:
+                return jsonify(error=f"{dimension.capitalize()} not found"), 404
+            ranked = ranked.filter(LEADERBOARD_PARTITIONS[dimension][0] == dimension_id)
+
+    ranked = ranked.subquery()
+    key_columns = [ranked.c[partition_keys[dimension]] for dimension in partitions] + [ranked.c.rank]
+    columns = [*key_columns, ranked.c.game_id, ranked.c.title, ranked.c.value]
+    joins = []
+
+    for dimension in partitions:
+        name_model = LEADERBOARD_PARTITIONS[dimension][1]
+        if name_model is not None:
+            columns.append(name_model.name.label(dimension))
+            joins.append((name_model, name_model.id == ranked.c[partition_keys[dimension]]))
+
+    query = session.query(*columns)
+    for name_model, condition in joins:
+        query = query.join(name_model, condition)
+
+    results, next_cursor = paginate(query.filter(ranked.c.rank <= top), key_columns)
+
+    leaderboard = [{
+        **{dimension: getattr(row, dimension) for dimension in partitions},
+        "rank": row.rank,
+        "game_id": row.game_id,
+        "title": row.title,
+        value_name: row.value
+    } for row in results]
+
+    return jsonify(leaderboard=leaderboard, next_cursor=next_cursor), 200
+
+
+# Get the best-selling games of each year, platform, genre and/or developer, by their total over all years unless
+# ranked within or filtered on years
+@api.route('/api/leaderboards/sales')
+@conditional(session, SALES_LEADERBOARD_TABLES)
+def get_sales_leaderboard():
+    metric = request.args.get('metric', 'sales')
+
+    if metric not in SALES_LEADERBOARD_METRICS:
+        return jsonify(error=f"metric must be one of {', '.join(SALES_LEADERBOARD_METRICS)}"), 400
+
+    return get_leaderboard(Sales, SALES_LEADERBOARD_METRICS[metric], metric,
+                           lambda value: cast(func.sum(value), BigInteger))
+
+
+# Get the most expensive games of each year, platform, genre and/or developer, by their highest price over all years
+# unless ranked within or filtered on years
+@api.route('/api/leaderboards/pricing')
+@conditional(session, PRICING_LEADERBOARD_TABLES)
+def get_pricing_leaderboard():
+    return get_leaderboard(Pricing, Pricing.price, "price", func.max)
+
+
+# ============================ LEADERBOARDS END =======================================
+
+
+# ============================ ANALYTICS START =======================================
+
+# Compute the time series of the selected games, of every game of a platform, or of both, and build the response
+def timeseries_response(game_ids, platform_name, group, window):
+    if game_ids is None and not platform_name:
+        return jsonify(error="game_ids or platform is required"), 400
+
+    if group not in ('game', 'platform'):
+        return jsonify(error="group must be game or platform"), 400
+
+    if not isinstance(window, int) or isinstance(window, bool) or window < 1:
+        return jsonify(error="window must be a positive integer"), 400
+
+    if game_ids is not None and len(game_ids) > MAX_ANALYTICS_GAMES:
+        return jsonify(error=f"At most {MAX_ANALYTICS_GAMES} game_ids can be requested at once"), 400
+
+    platform_id = None
+    if platform_name:
+        platform_id = platform_cache.get_id(session, platform_name)
+        if not platform_id:
+            return jsonify(error="Platform not found"), 404
+
+    history = analytics.load_history(session, game_ids=game_ids, platform_id=platform_id)
+    key = 'game_id'
+
+    if group == 'platform':
+        history = analytics.aggregate_by_platform(history)
+        key = 'platform_id'
+
+    metrics = analytics.compute_metrics(history, key, window=window)
+
+    return jsonify(series=analytics.to_series(history, metrics, key)), 200
+
+
+# Get price and sales time series with year-over-year, moving average, cumulative and digital share metrics
+@api.route('/api/analytics/timeseries')
+@conditional(session, ANALYTICS_TABLES)
+def get_timeseries():
+    game_ids = request.args.get('game_ids')
+
+    if game_ids is not None:
+        try:
+            game_ids = [int(game_id) for game_id in game_ids.split(',')]
+        except ValueError:
+            return jsonify(error="game_ids must be a comma separated list of ids"), 400
+
+    try:
+        window = int(request.args.get('window', 3))
+    except ValueError:
+        return jsonify(error="window must be a positive integer"), 400
+
+    return timeseries_response(game_ids, request.args.get('platform'), request.args.get('group', 'game'), window)
+
+
+# Same as the GET route, with the selection in a JSON body for lists of game ids too long for a query string.
+# Different bodies share one URL, so these responses are neither conditional nor cached.
+@api.route('/api/analytics/timeseries', methods=['POST'])
+def post_timeseries():
+    body = request.get_json(silent=True)
+
+    if not isinstance(body, dict):
+        return jsonify(error="The body must be a JSON object"), 400
+
+    game_ids = body.get('game_ids')
+    if game_ids is not None and (not isinstance(game_ids, list) or not all(
+            isinstance(game_id, int) and not isinstance(game_id, bool) for game_id in game_ids)):
+        return jsonify(error="game_ids must be a list of integers"), 400
+
+    platform_name = body.get('platform')
+    if platform_name is not None and not isinstance(platform_name, str):
+        return jsonify(error="platform must be a string"), 400
+
+    return timeseries_response(game_ids, platform_name, body.get('group', 'game'), body.get('window', 3))
+
+
+# ============================ ANALYTICS END =======================================
+
+
+# ============================ CHANGES START =======================================
+
+# The model, response fields and serializer of the pricing and sales rows in the change feed
+CHANGE_FEED_HISTORY = {
+    "prices": (Pricing, PRICING_FIELDS, pricing_to_dict),
+    "sales": (Sales, SALES_FIELDS, sales_to_dict)
+}
+
+
+# Read the current state of changed rows of a table, keyed by (game_id, year) with a year of None for games
+def read_changed_rows(table_name, keys):
+    if table_name == "games":
+        games = query_games_with_names().filter(Game.id.in_([game_id for game_id, _ in keys])).all()
+        return {(game.id, None): game_to_dict(game) for game in games}
+
+    model, fields, to_dict = CHANGE_FEED_HISTORY[table_name]
+    rows = query_with_game_names(model, fields).filter(tuple_(model.game_id, model.year).in_(keys)).all()
+    return {(row.game_id, row.year): {"game_id": row.game_id, **to_dict(row, fields)} for row in rows}
+
+
+# Get the games, pricing and sales rows inserted, updated or deleted after the since cursor, in the order their
+# transactions committed. Deleted rows are returned as tombstones without a row. Not conditional: the change log
+# has no version of its own that the tables it tracks would change.
+@api.route('/api/changes')
+def get_changes():
+    limit = get_page_size()
+    since = request.args.get('since')
+    key_columns = (ChangeLog.commit_sequence, ChangeLog.id)
+    query = session.query(ChangeLog).filter(ChangeLog.commit_sequence.isnot(None))
+
+    if since:
+        query = query.filter(tuple_(*key_columns) > tuple_(*decode_cursor(since, key_columns)))
+
+    entries = query.order_by(*key_columns).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Only the latest entry of each row matters, and it is served with the row as it is now
+    latest = {}
+    for entry in entries:
+        key = (entry.table_name, entry.game_id, entry.year)
+        latest.pop(key, None)
+        latest[key] = entry
+
+    rows = {}
+    for table_name in TRACKED_TABLES.values():
+        keys = [(game_id, year) for (table, game_id, year), entry in latest.items()
+                if table == table_name and entry.operation == UPSERT]
+        rows[table_name] = read_changed_rows(table_name, keys) if keys else {}
+
+    changes = []
+    for (table_name, game_id, year), entry in latest.items():
+        change = {"table": table_name, "operation": entry.operation, "game_id": game_id, "year": year,
+                  "changed_at": entry.changed_at}
+        if entry.operation == UPSERT:
+            change["row"] = rows[table_name].get((game_id, year))
+            # Deleted by a later transaction, whose tombstone comes after this entry
+            if change["row"] is None:
+                continue
+        changes.append(change)
+
+    next_cursor = encode_cursor([entries[-1].commit_sequence, entries[-1].id]) if entries else since
+
+    return jsonify(changes=changes, next_cursor=next_cursor, has_more=has_more), 200
+
+
+# ============================ CHANGES END =======================================
+
+
+# ============================ SNAPSHOTS START =======================================
+
+# Dataset exports written by flask snapshot: the function building each query, its row serializer and the tables
+# it reads from, whose versions decide whether it has to be rebuilt
+SNAPSHOT_EXPORTS = {
+    "games": (lambda: query_games_with_names().order_by(Game.id), game_to_dict, GAME_TABLES),
+    "pricing": (lambda: query_with_game_names(Pricing, PRICING_FIELDS).order_by(Pricing.game_id, Pricing.year),
+                lambda pricing: {"game_id": pricing.game_id, **pricing_to_dict(pricing)}, PRICING_TABLES),
+    "sales": (lambda: query_with_game_names(Sales, SALES_FIELDS).order_by(Sales.game_id, Sales.year),
+              lambda sale: {"game_id": sale.game_id, **sales_to_dict(sale)}, SALES_TABLES)
+}
+
+
+# Write the snapshots whose tables changed since they were last built, once or every --interval seconds
+@api.cli.command("snapshot")
+@click.option("--interval", type=float, help="Keep rebuilding every INTERVAL seconds.")
+@click.option("--force", is_flag=True, help="Rebuild snapshots whose tables did not change.")
+def snapshot_command(interval, force):
+    while True:
+        # Exports are the heaviest reads there are, so they come from the replica when there is one
+        session().use_replica()
+        try:
+            rebuilt = build_snapshots(session, SNAPSHOT_EXPORTS, current_app.json.dumps, force=force)
+        finally:
+            session.remove()
+
+        click.echo(f"Rebuilt {', '.join(rebuilt)}." if rebuilt else "Snapshots are up to date.")
+        if interval is None:
+            break
+        force = False
+        time.sleep(interval)
+
+
+# List the snapshots that have been built, with their size, row count and build time
+@api.route('/api/snapshots')
+def get_snapshots():
+    manifest = read_manifest()
+    snapshots = [{
+        "name": name,
+        "url": url_for("api.get_snapshot", name=name),
+        "rows": manifest[name]["rows"],
+        "bytes": manifest[name]["bytes"],
+        "built_at": manifest[name]["built_at"]
+    } for name in SNAPSHOT_EXPORTS if name in manifest]
+
+    return jsonify(snapshots=snapshots), 200
+
+
+# Download a snapshot as gzip compressed NDJSON straight from disk, with ETag, Last-Modified and Range support
+@api.route('/api/snapshots/<name>')
+def get_snapshot(name):
+    path = snapshot_path(name)
+
+    if name not in SNAPSHOT_EXPORTS or not os.path.exists(path):
+        return jsonify(error="Snapshot not found"), 404
+
+    return send_file(path, mimetype="application/gzip", as_attachment=True, download_name=os.path.basename(path),
+                     conditional=True)
+
+
+# ============================ SNAPSHOTS END =======================================
+
+# Build the app without connecting to the database, so workers start fast even when it is slow or unreachable
+def create_app():
+    app = Flask(__name__)
+    app.json = create_json_provider(app)
+    app.after_request(compress_response)
+    app.before_request(route_reads_to_replica)
+    app.teardown_appcontext(remove_session)
+    init_response_cache(app, create_response_cache())
+    instrument_app(app)
+    instrument_engine()
+    app.register_blueprint(api)
+    return app
+
+
+app = create_app()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,227 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", 0.5))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+slow_query_logger = logging.getLogger("apivista.slow_query")
+
+# The state of a request served outside Flask, such as an async route of asgi.py
+async_request_state = contextvars.ContextVar("async_request_state", default=None)
+
+
+class Counter:
+    """
+    A thread-safe Prometheus counter with one value per combination of label values.
+    """
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    A thread-safe Prometheus histogram with one set of buckets per combination of
+    label values. Observing a value costs a binary search and a lock.
+    """
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    labels = format_labels(self.label_names + ("le",), label_values + (str(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class RequestState:
+    """
+    The metrics of a request served outside Flask, with the get and pop methods of
+    flask.g so record_query and record_request treat both alike.
+    """
+
+    def __init__(self, route):
+        self.route = route
+        self.metrics_start = time.perf_counter()
+
+    def get(self, name, default=None):
+        return self.__dict__.get(name, default)
+
+    def pop(self, name, default=None):
+        return self.__dict__.pop(name, default)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = (f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+request_duration = Histogram("apivista_http_request_duration_seconds",
+                             "Time spent handling a request, including streaming the body.", ("method", "route"))
+requests_total = Counter("apivista_http_requests_total", "Requests handled.", ("method", "route", "status"))
+request_queries = Histogram("apivista_http_request_queries", "SQL statements executed per request.",
+                            ("method", "route"), QUERY_COUNT_BUCKETS)
+request_db_duration = Histogram("apivista_http_request_db_seconds", "Time spent in SQL statements per request.",
+                                ("method", "route"))
+query_duration = Histogram("apivista_db_query_duration_seconds", "Time spent executing a single SQL statement.")
+slow_queries_total = Counter("apivista_db_slow_queries_total",
+                             f"SQL statements slower than {SLOW_QUERY_SECONDS}s.", ("route",))
+response_cache_lookups_total = Counter("apivista_response_cache_lookups_total",
+                                       "Response cache lookups by result, hit or miss.", ("result",))
+
+METRICS = (request_duration, requests_total, request_queries, request_db_duration, query_duration,
+           slow_queries_total, response_cache_lookups_total)
+
+
+def current_route():
+    """
+    :return: The URL rule of the current request, so /api/game/1 and /api/game/2 share
+             one series, or "unmatched" for 404s and code outside a request.
+    """
+    if has_request_context():
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+    state = async_request_state.get()
+    return state.route if state is not None else "unmatched"
+
+
+def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def record_query(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    query_duration.observe(elapsed)
+
+    state = g if has_request_context() else async_request_state.get()
+    if state is not None:
+        state.metrics_queries = state.get("metrics_queries", 0) + 1
+        state.metrics_db_time = state.get("metrics_db_time", 0.0) + elapsed
+
+    if elapsed >= SLOW_QUERY_SECONDS:
+        route = current_route()
+        slow_queries_total.inc(route)
+        slow_query_logger.warning("Slow query (%.3fs) on %s: %s", elapsed, route, statement)
+
+
+def instrument_engine(engine=Engine):
+    """
+    Times every statement the engine executes, adds it to the current request's
+    query count and DB time, and logs statements slower than SLOW_QUERY_SECONDS.
+    Instrumenting an engine twice has no effect.
+    :param engine: The engine to instrument, by default the Engine class so every
+                   engine is instrumented, including ones created later.
+    """
+    if not event.contains(engine, "after_cursor_execute", record_query):
+        event.listen(engine, "before_cursor_execute", start_query_timer)
+        event.listen(engine, "after_cursor_execute", record_query)
+
+
+def instrument_app(app):
+    """
+    Records the latency, status, query count and DB time of every request. Streamed
+    responses are recorded once the server closes them, so their latency and queries
+    include writing the body.
+    :param app: The Flask app to instrument.
+    """
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_streamed_request(response):
+        g.metrics_status = response.status_code
+
+        if response.is_streamed and "metrics_start" in g:
+            # g outlives the request context, and the body's queries keep adding to it.
+            state, method, route = g._get_current_object(), request.method, current_route()
+            g.metrics_streamed = True
+            response.call_on_close(lambda: record_request(state, method, route))
+
+        return response
+
+    @app.teardown_request
+    def record_finished_request(exception=None):
+        if not g.get("metrics_streamed"):
+            record_request(g, request.method, current_route())
+
+
+def record_request(state, method, route):
+    """
+    Adds a finished request to the request metrics.
+    :param state: The request's g object or RequestState.
+    :param method: The HTTP method of the request.
+    :param route: The URL rule of the request.
+    """
+    start = state.pop("metrics_start", None)
+    if start is None:
+        return
+
+    request_duration.observe(time.perf_counter() - start, method, route)
+    requests_total.inc(method, route, state.get("metrics_status", 500))
+    request_queries.observe(state.get("metrics_queries", 0), method, route)
+    request_db_duration.observe(state.get("metrics_db_time", 0.0), method, route)
+
+
+def render_metrics():
+    """
+    :return: Every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,5 @@
-from sqlalchemy import ForeignKey, Column, String, func, Integer, Float, Date
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import ForeignKey, Column, String, func, Integer, Float, Date, DateTime, Index, BigInteger
+from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
 
@@ -37,9 +37,19 @@ class Platform(Base):
 class Game(Base):
     """Model for Games table."""
     __tablename__ = "games"
+    __table_args__ = (
+        Index("ix_games_title_platform_id", "title", "platform_id"),
+        # Filtered and sorted listings: equality filters first, then the sort column and the id tie-breaker.
+        Index("ix_games_title_id", "title", "id"),
+        Index("ix_games_release_date_id", "release_date", "id"),
+        Index("ix_games_platform_id_release_date_id", "platform_id", "release_date", "id"),
+        Index("ix_games_genre_id_release_date_id", "genre_id", "release_date", "id"),
+        Index("ix_games_developer_id_release_date_id", "developer_id", "release_date", "id"),
+        Index("ix_games_platform_id_genre_id_release_date_id", "platform_id", "genre_id", "release_date", "id"),
+    )
     id = Column("id", Integer, primary_key=True)
     title = Column("title", String, nullable=False)
-    release_date = Column("release_date", Date, server_default=func.now(), onupdate=func.now(), nullable=False)
+    release_date = Column("release_date", Date, server_default=func.now(), nullable=False)
     description = Column("description", String, nullable=False)
     gameplay_modes = Column("gameplay_modes", String, nullable=False)
     img_url = Column("img_url", String)
@@ -47,6 +57,11 @@ class Game(Base):
     developer_id = Column("developer_id", Integer, ForeignKey("developers.id", ondelete="CASCADE"), index=True, nullable=False)
     genre_id = Column("genre_id", Integer, ForeignKey("genres.id", ondelete="CASCADE"), index=True, nullable=False)
     platform_id = Column("platform_id", Integer, ForeignKey("platforms.id", ondelete="CASCADE"), index=True, nullable=False)
+    updated_at = Column("updated_at", DateTime, default=func.now(), onupdate=func.now())
+
+    developer = relationship("Developer", lazy="raise")
+    genre = relationship("Genre", lazy="raise")
+    platform = relationship("Platform", lazy="raise")
 
     def __repr__(self):
         return f"Game_id: {self.id} Title: {self.title} Release_date: {self.release_date}"
@@ -55,9 +70,15 @@ class Game(Base):
 class Pricing(Base):
     """Model for Prices table."""
     __tablename__ = "prices"
+    __table_args__ = (
+        # Leaderboards scan one year of every game; the primary key leads with game_id and cannot serve them.
+        # On PostgreSQL the price is included so the scan never visits the table.
+        Index("ix_prices_year_game_id", "year", "game_id", postgresql_include=["price"]),
+    )
     game_id = Column("game_id", Integer, ForeignKey("games.id", ondelete="CASCADE"), primary_key=True)
     year = Column("year", Integer, primary_key=True)
     price = Column("price", Float)
+    updated_at = Column("updated_at", DateTime, default=func.now(), onupdate=func.now())
 
 
     def __repr__(self):
@@ -67,8 +88,60 @@ class Pricing(Base):
 class Sales(Base):
     """Model for Sales table."""
     __tablename__ = "sales"
+    __table_args__ = (
+        Index("ix_sales_year_game_id", "year", "game_id", postgresql_include=["digital_sales", "hard_copy_sales"]),
+    )
     game_id = Column("game_id", Integer, ForeignKey("games.id", ondelete="CASCADE"), primary_key=True)
     year = Column("year", Integer, primary_key=True)
     digital_sales = Column("digital_sales", Integer)
     hard_copy_sales = Column("hard_copy_sales", Integer)
+    updated_at = Column("updated_at", DateTime, default=func.now(), onupdate=func.now())
+
+
+class TrendRollup(Base):
+    """Model for Trend_rollups table, sales and pricing totals per year, platform, genre and developer."""
+    __tablename__ = "trend_rollups"
+    year = Column("year", Integer, primary_key=True)
+    platform_id = Column("platform_id", Integer, ForeignKey("platforms.id", ondelete="CASCADE"), primary_key=True)
+    genre_id = Column("genre_id", Integer, ForeignKey("genres.id", ondelete="CASCADE"), primary_key=True)
+    developer_id = Column("developer_id", Integer, ForeignKey("developers.id", ondelete="CASCADE"), primary_key=True)
+    digital_sales = Column("digital_sales", BigInteger, nullable=False, default=0)
+    hard_copy_sales = Column("hard_copy_sales", BigInteger, nullable=False, default=0)
+    price_total = Column("price_total", Float, nullable=False, default=0)
+    price_count = Column("price_count", Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"Year: {self.year} Platform_id: {self.platform_id} Genre_id: {self.genre_id} " \
+               f"Developer_id: {self.developer_id}"
 
+
+class TableVersion(Base):
+    """Model for Table_versions table, a write counter per table used to validate cached reads."""
+    __tablename__ = "table_versions"
+    name = Column("name", String, primary_key=True)
+    version = Column("version", Integer, nullable=False, default=0)
+    updated_at = Column("updated_at", DateTime)
+
+    def __repr__(self):
+        return f"Table: {self.name} Version: {self.version} Updated_at: {self.updated_at}"
+
+
+class ChangeLog(Base):
+    """Model for Change_log table, one entry per inserted, updated or deleted game, pricing or sales row."""
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_commit_sequence_id", "commit_sequence", "id"),
+    )
+    id = Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    table_name = Column("table_name", String, nullable=False)
+    # No foreign key, so the entries of deleted rows are kept as tombstones
+    game_id = Column("game_id", Integer, nullable=False)
+    year = Column("year", Integer)
+    operation = Column("operation", String, nullable=False)
+    changed_at = Column("changed_at", DateTime, nullable=False)
+    # The order transactions committed in, set as they commit; entries of uncommitted transactions have none
+    commit_sequence = Column("commit_sequence", BigInteger)
+
+    def __repr__(self):
+        return f"Change_id: {self.id} Table: {self.table_name} Game_id: {self.game_id} Year: {self.year} " \
+               f"Operation: {self.operation}"
@@ -0,0 +1,214 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from flask import request
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    """Raised when the limit or after query arguments cannot be used."""
+
+
+def encode_cursor(values):
+    """
+    Encodes the key values of the last row of a page into an opaque, URL-safe cursor.
+    :param values: The key column values of the last row.
+    :return: The cursor string.
+    """
+    payload = json.dumps([value.isoformat() if isinstance(value, date) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def load_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_cursor into its raw JSON values.
+    :param cursor: The cursor string sent by the client.
+    :return: A list of values.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise PaginationError("Invalid cursor.")
+
+    if not isinstance(values, list):
+        raise PaginationError("Invalid cursor.")
+
+    return values
+
+
+def decode_value(column, value):
+    """
+    Converts a raw cursor value to the Python type of its key column, so a crafted
+    cursor is rejected here rather than by the database driver.
+    :param column: The key column.
+    :param value: The raw JSON value.
+    :return: The value.
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+
+    # bool is an int, and null, lists and objects are never keys
+    if value is None or isinstance(value, (bool, list, dict)):
+        raise PaginationError("Invalid cursor.")
+
+    if python_type in (date, datetime):
+        if not isinstance(value, str):
+            raise PaginationError("Invalid cursor.")
+        try:
+            return python_type.fromisoformat(value)
+        except ValueError:
+            raise PaginationError("Invalid cursor.")
+
+    if python_type is float:
+        if not isinstance(value, (int, float)):
+            raise PaginationError("Invalid cursor.")
+        return float(value)
+
+    if python_type in (int, str) and not isinstance(value, python_type):
+        raise PaginationError("Invalid cursor.")
+
+    return value
+
+
+def decode_cursor(cursor, key_columns):
+    """
+    Decodes a cursor produced by encode_cursor back into key column values.
+    :param cursor: The cursor string sent by the client.
+    :param key_columns: The columns the cursor was built from.
+    :return: A list of values, one per key column.
+    """
+    values = load_cursor(cursor)
+
+    if len(values) != len(key_columns):
+        raise PaginationError("Invalid cursor.")
+
+    return [decode_value(column, value) for column, value in zip(key_columns, values)]
+
+
+def get_page_size(args=None):
+    """
+    Reads the limit query argument of the current request, or of args.
+    :param args: The query arguments, or None for those of the current Flask request.
+    :return: The number of rows to return, capped at MAX_PAGE_SIZE.
+    """
+    args = request.args if args is None else args
+    limit = args.get("limit", DEFAULT_PAGE_SIZE)
+
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise PaginationError("limit must be an integer.")
+
+    if limit < 1:
+        raise PaginationError("limit must be at least 1.")
+
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def seek_page(query, key_columns, descending, args):
+    """
+    Limits a query to the page the limit and after query arguments ask for. Rows are
+    ordered by the key columns and the page starts strictly after the row the cursor
+    points at. One row more than the page size is fetched to tell whether another
+    page follows.
+    :param query: The Query or select() statement to paginate.
+    :param key_columns: The columns that uniquely order the rows, e.g. the primary key.
+    :param descending: Whether to walk the key columns in descending order.
+    :param args: The query arguments.
+    :return: A tuple of the limited query and the page size.
+    """
+    limit = get_page_size(args)
+    after = args.get("after")
+
+    if after:
+        values = decode_cursor(after, key_columns)
+        key = tuple_(*key_columns) if len(key_columns) > 1 else key_columns[0]
+        bound = tuple_(*values) if len(key_columns) > 1 else values[0]
+        query = query.filter(key < bound if descending else key > bound)
+
+    order_by = [column.desc() if descending else column for column in key_columns]
+    return query.order_by(*order_by).limit(limit + 1), limit
+
+
+def end_page(rows, limit, key_columns):
+    """
+    :param rows: The rows fetched by a query limited by seek_page.
+    :param limit: The page size.
+    :param key_columns: The columns the page is ordered by.
+    :return: A tuple of the rows of the page and the cursor of the next page, or None
+             when this is the last page.
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in key_columns])
+
+    return rows, next_cursor
+
+
+def paginate(query, key_columns, descending=False):
+    """
+    Applies keyset pagination to a query using the limit and after query arguments
+    of the current request. Rows are ordered by the key columns and the page starts
+    strictly after the row the cursor points at, so every page costs one index range
+    scan no matter how deep it is.
+    :param query: The query to paginate.
+    :param key_columns: The columns that uniquely order the rows, e.g. the primary key.
+    :param descending: Whether to walk the key columns in descending order.
+    :return: A tuple of the rows of the page and the cursor of the next page, or None
+             when this is the last page.
+    """
+    query, limit = seek_page(query, key_columns, descending, request.args)
+    return end_page(query.all(), limit, key_columns)
+
+
+async def paginate_async(execute, statement, key_columns, args, descending=False):
+    """
+    The paginate of the ASGI app, for a select() statement run on an AsyncSession.
+    :param execute: session.scalars for a statement selecting an ORM entity, or
+                    session.execute for one selecting columns.
+    :param statement: The select() statement to paginate.
+    :param key_columns: The columns that uniquely order the rows, e.g. the primary key.
+    :param args: The query arguments of the request.
+    :param descending: Whether to walk the key columns in descending order.
+    :return: A tuple of the rows of the page and the cursor of the next page, or None
+             when this is the last page.
+    """
+    statement, limit = seek_page(statement, key_columns, descending, args)
+    return end_page((await execute(statement)).all(), limit, key_columns)
+
+
+def paginate_by_position(query):
+    """
+    Pages through a query that is already ordered by a computed value, such as a
+    search relevance score, which no index can seek into. The cursor holds the
+    number of rows already returned instead of a key.
+    :param query: The ordered query to paginate.
+    :return: A tuple of the rows of the page and the cursor of the next page, or None
+             when this is the last page.
+    """
+    limit = get_page_size()
+    after = request.args.get("after")
+    offset = 0
+
+    if after:
+        values = load_cursor(after)
+        if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+            raise PaginationError("Invalid cursor.")
+        offset = values[0]
+
+    rows = query.offset(offset).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([offset + limit])
+
+    return rows, next_cursor
@@ -0,0 +1,222 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from metrics import response_cache_lookups_total
+from versioning import COMMITTED_TABLES_KEY, RESPONSE_CACHE_EXTENSION
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is optional
+    redis = None
+
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", 64 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")
+REDIS_KEY_PREFIX = "apivista:response:"
+REDIS_TAG_PREFIX = "apivista:tag:"
+
+logger = logging.getLogger("apivista.response_cache")
+
+
+class MemoryBackend:
+    """
+    A thread-safe in-process LRU store holding at most max_bytes of keys and values.
+    Entries expire after ttl seconds, and the least recently used entries are evicted
+    to make room for new ones. Each worker process has its own.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES, ttl=RESPONSE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_tag = {}
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, tags):
+        size = len(key) + len(value)
+        # A single entry may not take more than a quarter of the budget.
+        if size * 4 > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            while self._size + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            self._size += size
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._keys_by_tag.pop(tag, ()):
+                    self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= len(key) + len(entry[1])
+        for tag in entry[2]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+class RedisBackend:
+    """
+    A store shared by every worker, in Redis. Each tag is a set of the keys tagged
+    with it, so invalidating a tag deletes its entries for all workers at once. Redis
+    errors are logged and treated as misses, so an unreachable Redis only costs the
+    cache, never the request.
+    """
+
+    def __init__(self, url, ttl=RESPONSE_CACHE_TTL):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+
+    def get(self, key):
+        try:
+            return self.client.get(REDIS_KEY_PREFIX + key)
+        except redis.RedisError as error:
+            logger.warning("Response cache get failed: %s", error)
+            return None
+
+    def set(self, key, value, tags):
+        try:
+            pipeline = self.client.pipeline()
+            pipeline.set(REDIS_KEY_PREFIX + key, value, ex=self.ttl)
+            for tag in tags:
+                pipeline.sadd(REDIS_TAG_PREFIX + tag, REDIS_KEY_PREFIX + key)
+                pipeline.expire(REDIS_TAG_PREFIX + tag, self.ttl)
+            pipeline.execute()
+        except redis.RedisError as error:
+            logger.warning("Response cache set failed: %s", error)
+
+    def invalidate(self, tags):
+        try:
+            for tag in tags:
+                keys = self.client.smembers(REDIS_TAG_PREFIX + tag)
+                self.client.delete(REDIS_TAG_PREFIX + tag, *keys)
+        except redis.RedisError as error:
+            logger.warning("Response cache invalidation failed: %s", error)
+
+
+class ResponseCache:
+    """
+    Caches the bodies of GET responses, tagged with the tables they were built from.
+    Callers include the response's ETag in the key, which changes with the table
+    versions, so a worker never serves an entry built before another worker's write.
+    Tags let a commit evict the entries it made stale right away instead of leaving
+    them to age out.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, key):
+        """
+        :param key: The key of the response.
+        :return: A (content type, body) tuple, or None on a miss.
+        """
+        value = self.backend.get(key)
+        response_cache_lookups_total.inc("miss" if value is None else "hit")
+        if value is None:
+            return None
+        content_type, _, body = value.partition(b"\n")
+        return content_type.decode(), body
+
+    def set(self, key, content_type, body, tags):
+        """
+        :param key: The key of the response.
+        :param content_type: The Content-Type of the response.
+        :param body: The body of the response as bytes.
+        :param tags: The names of the tables the response was built from.
+        """
+        self.backend.set(key, content_type.encode() + b"\n" + body, tuple(tags))
+
+    def invalidate(self, tables):
+        """
+        Evicts every entry built from one of the tables.
+        :param tables: The names of the changed tables.
+        """
+        self.backend.invalidate(tables)
+
+
+def create_response_cache():
+    """
+    Builds the cache configured by the environment: Redis when RESPONSE_CACHE_URL is
+    set and the redis package is installed, otherwise an in-process LRU holding up to
+    RESPONSE_CACHE_BYTES (default 64 MiB). Entries expire after RESPONSE_CACHE_TTL
+    seconds (default 300).
+    :return: A ResponseCache, or None when RESPONSE_CACHE_BYTES is 0.
+    """
+    if RESPONSE_CACHE_URL and redis is not None:
+        return ResponseCache(RedisBackend(RESPONSE_CACHE_URL))
+    if RESPONSE_CACHE_BYTES <= 0:
+        return None
+    return ResponseCache(MemoryBackend())
+
+
+def init_response_cache(app, cache):
+    """
+    Makes cache the response cache of app, used by versioning.conditional.
+    :param app: The Flask app.
+    :param cache: A ResponseCache, or None to disable caching.
+    """
+    if cache is None:
+        app.extensions.pop(RESPONSE_CACHE_EXTENSION, None)
+    else:
+        app.extensions[RESPONSE_CACHE_EXTENSION] = cache
+
+
+def get_response_cache():
+    """
+    :return: The response cache of the current app, or None.
+    """
+    if not has_app_context():
+        return None
+    return current_app.extensions.get(RESPONSE_CACHE_EXTENSION)
+
+
+def invalidate_shared_cache(tables):
+    """
+    Evicts the entries built from the tables from the Redis cache shared by the
+    workers, for writers that run outside the app such as loader.py. The in-process
+    caches of the workers cannot be reached from another process; their stale
+    entries are never served, since their keys hold the old ETag, and expire after
+    RESPONSE_CACHE_TTL seconds.
+    :param tables: The names of the changed tables.
+    """
+    if RESPONSE_CACHE_URL and redis is not None:
+        ResponseCache(RedisBackend(RESPONSE_CACHE_URL)).invalidate(tables)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_tables(session):
+    tables = session.info.pop(COMMITTED_TABLES_KEY, None)
+    cache = get_response_cache()
+
+    if tables and cache is not None:
+        cache.invalidate(tables)
@@ -0,0 +1,179 @@
+from sqlalchemy import delete, event, func, insert, inspect, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from models import Game, Pricing, Sales, TrendRollup
+
+ROLLUP_KEYS_KEY = "rollup_keys"
+DIMENSIONS = ("year", "platform_id", "genre_id", "developer_id")
+KEY_COLUMNS = (TrendRollup.year, TrendRollup.platform_id, TrendRollup.genre_id, TrendRollup.developer_id)
+TOTAL_COLUMNS = ("digital_sales", "hard_copy_sales", "price_total", "price_count")
+DIALECT_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+
+def dialect_name(connection):
+    bind = connection if isinstance(connection, Connection) else connection.get_bind()
+    return bind.dialect.name
+
+
+def aggregate(connection, keys=None):
+    """
+    Computes rollup rows from the sales and prices tables with GROUP BY.
+    :param connection: A session or connection.
+    :param keys: Optional (year, platform_id, genre_id, developer_id) tuples to limit the aggregation to.
+    :return: A dict mapping each key to a dict of TrendRollup column values.
+    """
+    sales = select(Sales.year, Game.platform_id, Game.genre_id, Game.developer_id,
+                   func.coalesce(func.sum(Sales.digital_sales), 0),
+                   func.coalesce(func.sum(Sales.hard_copy_sales), 0)) \
+        .join(Game, Game.id == Sales.game_id) \
+        .group_by(Sales.year, Game.platform_id, Game.genre_id, Game.developer_id)
+    prices = select(Pricing.year, Game.platform_id, Game.genre_id, Game.developer_id,
+                    func.coalesce(func.sum(Pricing.price), 0), func.count(Pricing.price)) \
+        .join(Game, Game.id == Pricing.game_id) \
+        .group_by(Pricing.year, Game.platform_id, Game.genre_id, Game.developer_id)
+
+    if keys is not None:
+        sales = sales.where(tuple_(Sales.year, Game.platform_id, Game.genre_id, Game.developer_id).in_(keys))
+        prices = prices.where(tuple_(Pricing.year, Game.platform_id, Game.genre_id, Game.developer_id).in_(keys))
+
+    rows = {}
+    for *key, digital_sales, hard_copy_sales in connection.execute(sales):
+        row = rows.setdefault(tuple(key), dict(zip(DIMENSIONS, key), price_total=0, price_count=0))
+        row.update(digital_sales=digital_sales, hard_copy_sales=hard_copy_sales)
+
+    for *key, price_total, price_count in connection.execute(prices):
+        row = rows.setdefault(tuple(key), dict(zip(DIMENSIONS, key), digital_sales=0, hard_copy_sales=0))
+        row.update(price_total=price_total, price_count=price_count)
+
+    return rows
+
+
+def refresh_rollup(connection, keys):
+    """
+    Recomputes the rollup rows of the given keys from the sales and prices tables.
+    Only the games in those slices are read, so the cost of a write stays flat as
+    the catalog grows.
+
+    Two transactions writing to the same slice would each aggregate without the
+    other's uncommitted rows, so the slice's rollup row is locked first: a missing
+    row is inserted, and every row is then selected FOR UPDATE, both in key order so
+    two writers cannot deadlock. The second writer waits for the first to commit and
+    aggregates with its rows. The totals are then upserted, and the rows of slices
+    left empty are deleted.
+    :param connection: A session or connection in the transaction that changed the data.
+    :param keys: (year, platform_id, genre_id, developer_id) tuples to recompute.
+    """
+    keys = sorted(keys)
+    if not keys:
+        return
+
+    dialect_insert = DIALECT_INSERTS[dialect_name(connection)]
+    key = tuple_(*KEY_COLUMNS)
+
+    connection.execute(dialect_insert(TrendRollup).values(
+        [dict(zip(DIMENSIONS, rollup_key), **dict.fromkeys(TOTAL_COLUMNS, 0)) for rollup_key in keys])
+        .on_conflict_do_nothing())
+    connection.execute(select(*KEY_COLUMNS).where(key.in_(keys)).order_by(*KEY_COLUMNS).with_for_update())
+
+    rows = aggregate(connection, keys)
+    if rows:
+        statement = dialect_insert(TrendRollup)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=list(DIMENSIONS),
+            set_={column: statement.excluded[column] for column in TOTAL_COLUMNS}), list(rows.values()))
+
+    empty = [rollup_key for rollup_key in keys if rollup_key not in rows]
+    if empty:
+        connection.execute(delete(TrendRollup).where(key.in_(empty)))
+
+
+def rebuild_rollup(connection):
+    """
+    Recomputes the whole rollup table, e.g. after a bulk load.
+    :param connection: A session or connection.
+    """
+    # Waits for the writers refreshing slices to commit, so the aggregate includes their rows, and keeps new ones
+    # out until this transaction ends.
+    if dialect_name(connection) == "postgresql":
+        connection.execute(text(f"LOCK TABLE {TrendRollup.__tablename__} IN EXCLUSIVE MODE"))
+
+    rows = aggregate(connection)
+    connection.execute(delete(TrendRollup))
+    if rows:
+        connection.execute(insert(TrendRollup), list(rows.values()))
+
+
+def rollup_keys(session, game_years):
+    """
+    Maps (game_id, year) pairs to the rollup keys they contribute to.
+    :param session: The session used to look up the games.
+    :param game_years: (game_id, year) tuples.
+    :return: A set of (year, platform_id, genre_id, developer_id) tuples.
+    """
+    game_years = {(game_id, int(year)) for game_id, year in game_years if game_id is not None and year is not None}
+    if not game_years:
+        return set()
+
+    with session.no_autoflush:
+        games = session.query(Game.id, Game.platform_id, Game.genre_id, Game.developer_id) \
+            .filter(Game.id.in_({game_id for game_id, _ in game_years})).all()
+    dimensions = {game.id: (game.platform_id, game.genre_id, game.developer_id) for game in games}
+
+    return {(year, *dimensions[game_id]) for game_id, year in game_years if game_id in dimensions}
+
+
+@event.listens_for(Session, "before_flush")
+def track_rollup_keys(session, flush_context, instances):
+    game_years = set()
+
+    for instance in session.new | session.dirty | session.deleted:
+        if isinstance(instance, (Pricing, Sales)):
+            state = inspect(instance)
+            for attribute in ("game_id", "year"):
+                history = state.attrs[attribute].history
+                if history.deleted:
+                    game_years.add((history.deleted[0], instance.year) if attribute == "game_id"
+                                   else (instance.game_id, history.deleted[0]))
+            game_years.add((instance.game_id, instance.year))
+
+    keys = rollup_keys(session, game_years)
+
+    # Deleting a game cascades to its prices and sales in the database, so its slices are captured before the flush.
+    deleted_games = [instance for instance in session.deleted if isinstance(instance, Game)]
+    if deleted_games:
+        with session.no_autoflush:
+            for model in (Sales, Pricing):
+                rows = session.query(Game.platform_id, Game.genre_id, Game.developer_id, model.year) \
+                    .join(model, model.game_id == Game.id) \
+                    .filter(Game.id.in_([game.id for game in deleted_games])).all()
+                keys.update((row.year, row.platform_id, row.genre_id, row.developer_id) for row in rows)
+
+    if keys:
+        session.info.setdefault(ROLLUP_KEYS_KEY, set()).update(keys)
+
+
+@event.listens_for(Session, "before_commit")
+def refresh_tracked_rollup_keys(session):
+    session.flush()
+    keys = session.info.pop(ROLLUP_KEYS_KEY, None)
+
+    if keys:
+        refresh_rollup(session, keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_rollup_keys(session):
+    session.info.pop(ROLLUP_KEYS_KEY, None)
+
+
+if __name__ == "__main__":
+    import os
+
+    from dotenv import load_dotenv
+    from db import create_db_engine
+
+    load_dotenv()
+    with create_db_engine(os.getenv("AWS_POSTGRESQL_URL")).begin() as connection:
+        rebuild_rollup(connection)
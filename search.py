@@ -0,0 +1,70 @@
+from sqlalchemy import column, func, literal_column, table, text
+from models import Game
+
+POSTGRESQL_DDL = (
+    "ALTER TABLE games ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_games_search_vector ON games USING GIN (search_vector)",
+)
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE games_fts USING fts5(title, description, content='games', content_rowid='id')",
+    "CREATE TRIGGER games_fts_insert AFTER INSERT ON games BEGIN "
+    "INSERT INTO games_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER games_fts_delete AFTER DELETE ON games BEGIN "
+    "INSERT INTO games_fts(games_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "END",
+    "CREATE TRIGGER games_fts_update AFTER UPDATE OF title, description ON games BEGIN "
+    "INSERT INTO games_fts(games_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO games_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO games_fts(games_fts) VALUES ('rebuild')",
+)
+
+games_fts = table("games_fts", column("rowid"))
+
+
+def install_search_index(engine):
+    """
+    Creates the full-text index over game titles and descriptions if it does not exist.
+    On PostgreSQL this is a generated tsvector column with a GIN index, on SQLite an
+    FTS5 table kept in sync with the games table by triggers.
+    :param engine: The engine of the database.
+    """
+    backend = engine.url.get_backend_name()
+
+    with engine.begin() as connection:
+        if backend == "postgresql":
+            for statement in POSTGRESQL_DDL:
+                connection.execute(text(statement))
+        elif backend == "sqlite":
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'games_fts'")).scalar()
+            if not exists:
+                for statement in SQLITE_DDL:
+                    connection.execute(text(statement))
+
+
+def apply_search(query, dialect_name, terms):
+    """
+    Restricts a Game query to games matching the search terms and orders it by relevance.
+    Title matches rank above description matches.
+    :param query: A query selecting Game.
+    :param dialect_name: The name of the database dialect, "postgresql" or "sqlite".
+    :param terms: The search text as typed by the user.
+    :return: The filtered and ordered query.
+    """
+    if dialect_name == "postgresql":
+        search_vector = literal_column("games.search_vector")
+        ts_query = func.websearch_to_tsquery("english", terms)
+        return query.filter(search_vector.op("@@")(ts_query)) \
+            .order_by(func.ts_rank_cd(search_vector, ts_query).desc(), Game.id)
+
+    if dialect_name == "sqlite":
+        # Quote every word so FTS5 treats user input as plain terms rather than query syntax.
+        match = " ".join('"' + word.replace('"', '""') + '"' for word in terms.split())
+        return query.join(games_fts, games_fts.c.rowid == Game.id) \
+            .filter(text("games_fts MATCH :match").bindparams(match=match)) \
+            .order_by(text("bm25(games_fts, 10.0, 1.0)"), Game.id)
+
+    raise ValueError(f"Full-text search is not supported on {dialect_name}")
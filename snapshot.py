@@ -0,0 +1,114 @@
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+
+from versioning import get_table_versions, validators
+
+SNAPSHOT_DIR = os.path.abspath(os.getenv("SNAPSHOT_DIR", "snapshots"))
+SNAPSHOT_BATCH_SIZE = 1000
+# Snapshots are compressed once and downloaded many times, so they get the best ratio rather than the fastest.
+SNAPSHOT_GZIP_LEVEL = 9
+MANIFEST_NAME = "manifest.json"
+
+
+def snapshot_path(name, directory=SNAPSHOT_DIR):
+    """
+    :param name: The name of an export, e.g. "games".
+    :param directory: The snapshot directory.
+    :return: The path of the export's gzip compressed NDJSON file.
+    """
+    return os.path.join(directory, f"{name}.ndjson.gz")
+
+
+def read_manifest(directory=SNAPSHOT_DIR):
+    """
+    :param directory: The snapshot directory.
+    :return: A dict with the version, row count, size and build time of every
+             export built so far, keyed by export name.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_atomically(path, write):
+    """
+    Writes a file under a temporary name and renames it into place, so readers see
+    either the old or the new file, never a partial one. Downloads that already
+    opened the old file finish reading it.
+    :param path: The final path of the file.
+    :param write: A function writing the content to the binary file it is given.
+    """
+    temporary = f"{path}.tmp"
+    try:
+        with open(temporary, "wb") as file:
+            write(file)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def write_export(path, query, to_dict, dumps):
+    """
+    Streams every row of a query into a gzip compressed NDJSON file.
+    :return: The number of rows written.
+    """
+    rows = 0
+
+    def write(file):
+        nonlocal rows
+        # mtime=0 keeps the bytes of an unchanged export identical between builds.
+        with gzip.GzipFile(fileobj=file, mode="wb", compresslevel=SNAPSHOT_GZIP_LEVEL, mtime=0) as compressed:
+            lines = []
+            for row in query.yield_per(SNAPSHOT_BATCH_SIZE):
+                lines.append(dumps(to_dict(row)) + "\n")
+                rows += 1
+                if len(lines) == SNAPSHOT_BATCH_SIZE:
+                    compressed.write("".join(lines).encode())
+                    lines = []
+            compressed.write("".join(lines).encode())
+
+    write_atomically(path, write)
+    return rows
+
+
+def build_snapshots(session, exports, dumps, directory=SNAPSHOT_DIR, force=False):
+    """
+    Writes each export whose tables changed since it was last built. An export's
+    version is the fingerprint of its tables' versions, read before its rows, so a
+    write that lands during the build is picked up by the next one.
+    :param session: The session used for the queries.
+    :param exports: A dict mapping each export name to a tuple of a function that
+                    returns its query, the function serializing a row and the names
+                    of the tables it reads from.
+    :param dumps: The function serializing a dict to a JSON string.
+    :param directory: The snapshot directory.
+    :param force: Whether to rebuild exports that did not change.
+    :return: The names of the exports that were rebuilt.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    rebuilt = []
+
+    for name, (build_query, to_dict, tables) in exports.items():
+        version = validators(get_table_versions(session, tables))[0]
+        path = snapshot_path(name, directory)
+        if not force and manifest.get(name, {}).get("version") == version and os.path.exists(path):
+            continue
+
+        rows = write_export(path, build_query(), to_dict, dumps)
+        manifest[name] = {
+            "version": version,
+            "rows": rows,
+            "bytes": os.path.getsize(path),
+            "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+        }
+        write_atomically(os.path.join(directory, MANIFEST_NAME),
+                         lambda file: file.write(json.dumps(manifest, indent=2).encode()))
+        rebuilt.append(name)
+
+    return rebuilt
@@ -0,0 +1,91 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+# main.py creates its engine from AWS_POSTGRESQL_URL on first use, so the tests point it at a throwaway SQLite file
+# before any of them imports it. load_dotenv does not override a variable that is already set.
+os.environ["AWS_POSTGRESQL_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    from db import init_db
+    from response_cache import init_response_cache
+
+    init_db(main.session.get_bind())
+    # Every request runs its view, so the tests see its queries
+    init_response_cache(main.app, None)
+    return main.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def session(app):
+    import main
+
+    yield main.session
+    main.session.remove()
+
+
+@pytest.fixture
+def engine(session):
+    return session.get_bind()
+
+
+@pytest.fixture
+def add_games(session):
+    """
+    Empties the catalog, with its pricing and sales, and returns a function that adds
+    games to it, spread over two developers, genres and platforms named e.g. "Platform 1".
+    """
+    from models import Developer, Game, Genre, Platform, Pricing, Sales
+
+    # SQLite reuses the ids of deleted games, so their history has to go too
+    for model in (Pricing, Sales, Game):
+        session.query(model).delete()
+    for model in (Developer, Genre, Platform):
+        for number in (1, 2):
+            name = f"{model.__name__} {number}"
+            if not session.query(model).filter(model.name == name).first():
+                session.add(model(name=name))
+    session.commit()
+
+    def add(count):
+        dimensions = {model: session.query(model).order_by(model.id).all() for model in (Developer, Genre, Platform)}
+        games = [Game(title=f"Game {number}", description="A game", gameplay_modes="Single-player",
+                      release_date=date(2015, 1, 1) + timedelta(days=number),
+                      developer=dimensions[Developer][number % 2], genre=dimensions[Genre][number % 2],
+                      platform=dimensions[Platform][number % 2]) for number in range(count)]
+        session.add_all(games)
+        session.commit()
+        return [game.id for game in games]
+
+    return add
+
+
+@contextmanager
+def captured_statements(engine):
+    """
+    Records the SQL statements and parameters sent to the database inside the block.
+    :param engine: The engine to listen on.
+    :return: A list of (statement, parameters) tuples, filled as statements run.
+    """
+    statements = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,22 @@
+import json
+
+import numpy as np
+
+import analytics
+
+
+def test_price_change_from_a_free_year_is_null_in_json():
+    history = {
+        "game_id": np.array([1, 1, 1]),
+        "platform_id": np.array([1, 1, 1]),
+        "year": np.array([2020, 2021, 2022]),
+        "price": np.array([0.0, 10.0, 12.0]),
+        "digital_sales": np.array([1.0, 1.0, 1.0]),
+        "hard_copy_sales": np.array([0.0, 0.0, 0.0]),
+    }
+
+    series = analytics.to_series(history, analytics.compute_metrics(history, "game_id"), "game_id")
+
+    assert series[0]["yoy_price_change"] == [None, None, 0.2]
+    # The standard library would write an infinite value as Infinity, which is not JSON
+    json.dumps(series, allow_nan=False)
@@ -0,0 +1,68 @@
+import pytest
+from starlette.testclient import TestClient
+
+
+@pytest.fixture
+def asgi_client(app):
+    import asgi
+
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+@pytest.fixture
+def add_history(session, add_games):
+    """Adds three games with two years of pricing and sales each."""
+    from models import Pricing, Sales
+
+    for game_id in add_games(3):
+        for year in (2020, 2021):
+            session.add(Pricing(game_id=game_id, year=year, price=10.5 + year - 2020))
+            session.add(Sales(game_id=game_id, year=year, digital_sales=game_id, hard_copy_sales=year))
+    session.commit()
+
+
+@pytest.mark.parametrize("path", [
+    "/api/developer?limit=1",
+    "/api/genre",
+    "/api/platform",
+    "/api/game?limit=2",
+    "/api/game?sort=-title&platform=Platform 2",
+    "/api/game?released_from=2015-01-03&fields=title,developer",
+    "/api/game?sort=bogus",
+    "/api/game?genre=Nope",
+    "/api/game?limit=0",
+    "/api/pricing?limit=4&fields=price",
+    "/api/sales",
+])
+def test_async_listing_matches_flask(client, asgi_client, add_history, path):
+    expected = client.get(path)
+
+    response = asgi_client.get(path)
+
+    assert response.status_code == expected.status_code
+    assert response.json() == expected.get_json()
+
+
+def test_async_listing_follows_its_cursor(client, asgi_client, add_history):
+    first = asgi_client.get("/api/pricing?limit=4").json()
+
+    response = asgi_client.get(f"/api/pricing?limit=4&after={first['next_cursor']}")
+
+    assert response.json() == client.get(f"/api/pricing?limit=4&after={first['next_cursor']}").get_json()
+    assert len(first["pricings"]) + len(response.json()["pricings"]) == 6
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip"])
+def test_async_ndjson_export_matches_flask(client, asgi_client, add_history, encoding):
+    expected = client.get("/api/sales?format=ndjson&fields=year,digital_sales").get_data(as_text=True)
+
+    response = asgi_client.get("/api/sales?format=ndjson&fields=year,digital_sales",
+                               headers={"Accept-Encoding": encoding})
+
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert response.headers.get("Content-Encoding") == (None if encoding == "identity" else encoding)
+    assert response.text == expected
+    assert len(response.text.splitlines()) == 6
+    assert asgi_client.get("/api/sales?format=ndjson", headers={"If-None-Match": response.headers["ETag"]}) \
+        .status_code == 304
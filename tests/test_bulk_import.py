@@ -0,0 +1,22 @@
+import pytest
+
+GAME = {"title": "Imported", "description": "A game", "release_date": "January/31/2020",
+        "gameplay_modes": "Single-player", "developer": "Developer 1", "genre": "Genre 1", "platform": "Platform 1"}
+
+
+@pytest.mark.parametrize("field, value", [
+    ("developer", ["Developer 1"]),
+    ("genre", {"name": "Genre 1"}),
+    ("platform", 1),
+    ("title", 5),
+    ("release_date", 20200131),
+    ("img_url", ["https://example.com/cover.png"]),
+])
+def test_bulk_import_reports_non_string_fields_per_row(client, add_games, field, value):
+    add_games(0)
+    response = client.post("/api/game/bulk", json=[{**GAME, field: value}, GAME])
+
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert body["inserted"] == 1
+    assert body["errors"] == [{"row": 0, "error": f"Fields must be strings: {field}"}]
@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import captured_statements
+
+
+def explain_game_listing(client, engine, path):
+    """
+    Requests the second page of the game listing and runs EXPLAIN QUERY PLAN on the
+    games query it sent. Without a filter, a first page reads the sort index from its
+    start, which SQLite reports as a SCAN of the index; after a cursor it seeks into it.
+    :return: The detail lines of the plan.
+    """
+    first_page = client.get(f"{path}&limit=10")
+    assert first_page.status_code == 200, first_page.get_json()
+
+    with captured_statements(engine) as statements:
+        response = client.get(f"{path}&limit=10&after={first_page.get_json()['next_cursor']}")
+    assert response.status_code == 200, response.get_json()
+
+    statement, parameters = next((statement, parameters) for statement, parameters in statements
+                                 if "FROM games" in statement)
+    with engine.connect() as connection:
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+
+@pytest.mark.parametrize("query, index", [
+    ("platform=Platform 1&sort=release_date", "ix_games_platform_id_release_date_id"),
+    ("platform=Platform 1&sort=-release_date", "ix_games_platform_id_release_date_id"),
+    ("genre=Genre 1&sort=release_date", "ix_games_genre_id_release_date_id"),
+    ("developer=Developer 1&sort=release_date", "ix_games_developer_id_release_date_id"),
+    ("platform=Platform 1&genre=Genre 1&sort=release_date", "ix_games_platform_id_genre_id_release_date_id"),
+    ("platform=Platform 1&released_from=2015-01-10&released_to=2015-02-01&sort=release_date",
+     "ix_games_platform_id_release_date_id"),
+    ("released_from=2015-01-10&released_to=2015-02-01&sort=release_date", "ix_games_release_date_id"),
+    ("sort=release_date", "ix_games_release_date_id"),
+    ("sort=title", "ix_games_title_id"),
+    ("sort=-title", "ix_games_title_id"),
+])
+def test_game_listing_uses_its_index(client, engine, add_games, query, index):
+    add_games(50)
+    plan = explain_game_listing(client, engine, f"/api/game?{query}")
+
+    assert any(f"USING INDEX {index}" in line or f"USING COVERING INDEX {index}" in line for line in plan), plan
+    assert not any(line.startswith("SCAN games") for line in plan), plan
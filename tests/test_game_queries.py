@@ -0,0 +1,32 @@
+from conftest import captured_statements
+
+
+def count_queries(client, engine, path):
+    with captured_statements(engine) as statements:
+        response = client.get(path)
+    assert response.status_code == 200, response.get_json()
+    return len(statements), response.get_json()
+
+
+def test_game_listing_runs_the_same_queries_for_1_and_50_games(client, engine, add_games):
+    add_games(1)
+    queries_for_one, body = count_queries(client, engine, "/api/game")
+    assert len(body["games"]) == 1
+
+    add_games(49)
+    queries_for_fifty, body = count_queries(client, engine, "/api/game")
+    assert len(body["games"]) == 50
+    assert {game["developer"] for game in body["games"]} == {"Developer 1", "Developer 2"}
+
+    assert queries_for_one == queries_for_fifty
+
+
+def test_single_game_runs_the_same_queries_for_1_and_50_games(client, engine, add_games):
+    game_id = add_games(1)[0]
+    queries_for_one, body = count_queries(client, engine, f"/api/game/{game_id}")
+
+    add_games(49)
+    queries_for_fifty, body = count_queries(client, engine, f"/api/game/{game_id}")
+    assert body["game"][0]["developer"] == "Developer 1"
+
+    assert queries_for_one == queries_for_fifty
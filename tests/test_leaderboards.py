@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/api/leaderboards/sales", "/api/leaderboards/pricing"])
+def test_leaderboard_rejects_a_non_integer_year(client, add_games, path):
+    add_games(1)
+    response = client.get(f"{path}?year=abc")
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "year must be an integer"}
+
+
+def test_leaderboard_without_years_ranks_each_game_once_by_its_whole_history(client, session, add_games):
+    from models import Pricing, Sales
+
+    # Games alternate between Platform 1 and Platform 2
+    steady, hit, small = add_games(3)
+    session.add_all([Sales(game_id=steady, year=2010 + year, digital_sales=100, hard_copy_sales=0)
+                     for year in range(10)])
+    session.add(Sales(game_id=hit, year=2015, digital_sales=500, hard_copy_sales=0))
+    session.add(Sales(game_id=small, year=2015, digital_sales=50, hard_copy_sales=0))
+    session.add_all([Pricing(game_id=steady, year=2010, price=20), Pricing(game_id=steady, year=2011, price=30),
+                     Pricing(game_id=hit, year=2015, price=25)])
+    session.commit()
+
+    response = client.get("/api/leaderboards/sales?by=platform&top=3")
+    assert response.status_code == 200, response.get_json()
+    leaderboard = response.get_json()["leaderboard"]
+    assert [(row["platform"], row["rank"], row["game_id"], row["sales"]) for row in leaderboard] \
+        == [("Platform 1", 1, steady, 1000), ("Platform 1", 2, small, 50), ("Platform 2", 1, hit, 500)]
+
+    response = client.get("/api/leaderboards/pricing?by=&top=3")
+    assert [(row["rank"], row["game_id"], row["price"]) for row in response.get_json()["leaderboard"]] \
+        == [(1, steady, 30), (2, hit, 25)]
+
+    response = client.get("/api/leaderboards/sales?by=platform&year=2015&top=3")
+    assert [(row["rank"], row["game_id"], row["sales"]) for row in response.get_json()["leaderboard"]] \
+        == [(1, steady, 100), (2, small, 50), (1, hit, 500)]
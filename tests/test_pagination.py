@@ -0,0 +1,39 @@
+import base64
+import json
+
+import pytest
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("path, values", [
+    ("/api/developer", [[1]]),
+    ("/api/developer", ["x"]),
+    ("/api/developer", [True]),
+    ("/api/developer", [None]),
+    ("/api/game?sort=release_date", [1, 1]),
+    ("/api/game?sort=release_date", ["2020-13-01", 1]),
+    ("/api/game?sort=title", [{"title": "A"}, 1]),
+    ("/api/changes", [1, "x"]),
+    ("/api/leaderboards/sales?by=year", [[2020], 1]),
+])
+def test_crafted_cursor_is_rejected_with_400(client, add_games, path, values):
+    add_games(1)
+    argument = "since" if path.startswith("/api/changes") else "after"
+    separator = "&" if "?" in path else "?"
+
+    response = client.get(f"{path}{separator}{argument}={cursor(values)}")
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid cursor."}
+
+
+def test_cursor_of_a_page_still_reads_the_next_one(client, add_games):
+    add_games(3)
+    first = client.get("/api/game?sort=release_date&limit=2").get_json()
+
+    second = client.get(f"/api/game?sort=release_date&limit=2&after={first['next_cursor']}").get_json()
+
+    assert len(second["games"]) == 1
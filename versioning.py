@@ -0,0 +1,205 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from models import Base, TableVersion
+
+CHANGED_TABLES_KEY = "changed_tables"
+COMMITTED_TABLES_KEY = "committed_tables"
+# Where create_app keeps the optional ResponseCache of response_cache.py
+RESPONSE_CACHE_EXTENSION = "response_cache"
+
+
+def cascaded_tables(table_name):
+    """
+    Finds every table whose rows the database deletes when a row of the given table
+    is deleted, following ON DELETE CASCADE foreign keys transitively.
+    :param table_name: The name of the table a row is deleted from.
+    :return: A set of table names, including table_name itself.
+    """
+    tables = {table_name}
+    pending = [table_name]
+
+    while pending:
+        parent = pending.pop()
+        for table in Base.metadata.sorted_tables:
+            for foreign_key in table.foreign_keys:
+                if foreign_key.column.table.name == parent and foreign_key.ondelete == "CASCADE" \
+                        and table.name not in tables:
+                    tables.add(table.name)
+                    pending.append(table.name)
+
+    return tables
+
+
+def seed_table_versions(engine):
+    """
+    Inserts a version row for every table that does not have one yet.
+    :param engine: The engine of the database.
+    """
+    with engine.begin() as connection:
+        existing = set(connection.execute(select(TableVersion.name)).scalars())
+        missing = [{"name": table.name, "version": 0} for table in Base.metadata.sorted_tables
+                   if table.name not in existing and table.name != TableVersion.__tablename__]
+        if missing:
+            connection.execute(insert(TableVersion), missing)
+
+
+def bump_table_versions(session, tables):
+    """
+    Increments the version of each table in the current transaction. ORM writes are
+    tracked automatically; call this after bulk statements that bypass the ORM. On a
+    session, the tables are also evicted from the response cache once it commits.
+    :param session: The session or connection whose transaction wrote to the tables.
+    :param tables: The names of the tables that changed.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    # A connection's info outlives the transaction with the pooled connection, so only sessions record them
+    if not isinstance(session, Connection):
+        session.info.setdefault(COMMITTED_TABLES_KEY, set()).update(tables)
+
+    for name in sorted(tables):
+        result = session.execute(update(TableVersion).where(TableVersion.name == name)
+                                 .values(version=TableVersion.version + 1, updated_at=now))
+        if result.rowcount == 0:
+            session.execute(insert(TableVersion).values(name=name, version=1, updated_at=now))
+
+
+def select_table_versions(tables):
+    """
+    :param tables: The names of the tables.
+    :return: A statement selecting the name, version and updated_at of each table.
+    """
+    return select(TableVersion.name, TableVersion.version, TableVersion.updated_at) \
+        .where(TableVersion.name.in_(tables))
+
+
+def versions_from_rows(tables, rows):
+    """
+    :param tables: The names of the tables.
+    :param rows: The rows of select_table_versions.
+    :return: A dict mapping each table name to a (version, updated_at) tuple.
+    """
+    versions = {name: (0, None) for name in tables}
+    versions.update({row.name: (row.version, row.updated_at) for row in rows})
+    return versions
+
+
+def get_table_versions(session, tables):
+    """
+    Reads the current version of each table in one query.
+    :param session: The session used for the query.
+    :param tables: The names of the tables.
+    :return: A dict mapping each table name to a (version, updated_at) tuple.
+    """
+    return versions_from_rows(tables, session.execute(select_table_versions(tables)).all())
+
+
+def validators(versions):
+    """
+    Derives the validators of a response from the versions of the tables it reads.
+    :param versions: The result of get_table_versions.
+    :return: A tuple of the ETag and the Last-Modified datetime, which is None while
+             none of the tables has been written to.
+    """
+    fingerprint = ",".join(f"{name}:{versions[name][0]}" for name in sorted(versions))
+    etag = hashlib.sha1(fingerprint.encode()).hexdigest()
+    timestamps = [updated_at for _, updated_at in versions.values() if updated_at]
+    last_modified = max(timestamps).replace(tzinfo=timezone.utc, microsecond=0) if timestamps else None
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """
+    :param etag: The ETag of the current response.
+    :param last_modified: The Last-Modified datetime of the current response, or None.
+    :param if_none_match: The parsed If-None-Match header of the request.
+    :param if_modified_since: The parsed If-Modified-Since header of the request, or None.
+    :return: True if the client's copy is still current. If-None-Match takes
+             precedence over If-Modified-Since.
+    """
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    return bool(last_modified and if_modified_since and last_modified <= if_modified_since)
+
+
+@event.listens_for(Session, "after_flush")
+def track_changed_tables(session, flush_context):
+    changed = session.info.setdefault(CHANGED_TABLES_KEY, set())
+
+    for instance in session.new | session.dirty:
+        if session.is_modified(instance):
+            changed.add(instance.__table__.name)
+
+    for instance in session.deleted:
+        changed.update(cascaded_tables(instance.__table__.name))
+
+    changed.discard(TableVersion.__tablename__)
+
+
+@event.listens_for(Session, "before_commit")
+def bump_changed_tables(session):
+    session.flush()
+    changed = session.info.pop(CHANGED_TABLES_KEY, None)
+
+    if changed:
+        # Also records the tables for the response cache to evict once the commit has succeeded
+        bump_table_versions(session, changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_tables(session):
+    session.info.pop(CHANGED_TABLES_KEY, None)
+    session.info.pop(COMMITTED_TABLES_KEY, None)
+
+
+def conditional(session, tables):
+    """
+    Decorates a GET view so it answers If-None-Match and If-Modified-Since with a
+    304 Not Modified while none of the tables it reads from have changed. The
+    validators come from one query against the table versions, so an unchanged
+    poll never runs the view itself. When the app has a response cache, the bodies of
+    200 responses to GET and HEAD requests are cached under their path, query arguments
+    and ETag, so repeated reads of unchanged tables do not run the view either.
+    :param session: The session used to read the table versions.
+    :param tables: The names of every table the view reads from.
+    :return: The decorator.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = validators(get_table_versions(session, tables))
+
+            if is_not_modified(etag, last_modified, request.if_none_match, request.if_modified_since):
+                response = make_response("", 304)
+            else:
+                # Other methods carry a body the key does not cover
+                cache = current_app.extensions.get(RESPONSE_CACHE_EXTENSION) \
+                    if request.method in ("GET", "HEAD") else None
+                key = f"{request.path}?{urlencode(sorted(request.args.items(multi=True)))}#{etag}"
+                cached = cache.get(key) if cache is not None else None
+
+                if cached is not None:
+                    response = current_app.response_class(cached[1], content_type=cached[0])
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if cache is not None and not response.is_streamed:
+                        cache.set(key, response.content_type, response.get_data(), tables)
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator